@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.gis',
+    'django.contrib.postgres',
     'cities',
     'localgreentips.tips',
     'rest_framework',
@@ -48,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'localgreentips.tips.timing.TimingMiddleware',
+    'localgreentips.tips.routers.ReplicaMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -93,6 +96,37 @@ DATABASES = {
     }
 }
 
+# Read replicas of the default database, as a comma separated list of
+# hosts. Reads of safe requests are spread over them, except for clients
+# which wrote in the last REPLICA_STICKY_SECONDS. Tests use the default
+# database for every replica, so a local replica can be the same host.
+REPLICA_DATABASES = []
+for index, host in enumerate(config('DB_REPLICA_HOSTS', cast=Csv(),
+                                    default=''), 1):
+    alias = 'replica{}'.format(index)
+    DATABASES[alias] = dict(DATABASES['default'], HOST=host,
+                            TEST={'MIRROR': 'default'})
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['localgreentips.tips.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', cast=int,
+                                default=10)
+
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+# Cached feeds, rankings, ETags and tokens are invalidated through this cache,
+# it must be shared by every process when running several workers, see
+# ./manage.py check --deploy.
+
+CACHES = {
+    'default': {
+        'BACKEND': config(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -130,6 +164,11 @@ LOGGING = {
 }
 
 
+# Ratio of the requests whose phases and queries are timed, see
+# localgreentips/tips/timing.py
+TIMING_SAMPLE_RATE = config('TIMING_SAMPLE_RATE', cast=float, default=0.01)
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/2.1/topics/i18n/
 
@@ -159,14 +198,96 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'localgreentips.tips.authentication.CachedTokenAuthentication',
     ],
 }
 
+# Lifetime in seconds of the cached authentication tokens, they are
+# invalidated on logout and on user changes.
+TOKEN_CACHE_TTL = config('TOKEN_CACHE_TTL', cast=int, default=300)
+
 # Don't import postal codes
 CITIES_POSTAL_CODES = []
 CITIES_LOCALES = ['ALL']
 
+# Nearby cities used to find local tips and to search cities
+TIP_NEARBY_RADIUS_KM = 50
+TIP_NEARBY_CITIES = 10
+CITY_NEARBY_RADIUS_KM = 100
+
+# Tips of a map area, from at most TIP_AREA_MAX_CITIES cities
+TIP_AREA_PAGE_SIZE = 200
+TIP_AREA_MAX_CITIES = 5000
+TIP_AREA_MAX_RADIUS_KM = 500
+
+# Boost of local tips, by level at which they match the requested location.
+# A tip ranks with score + (score + 1) * sum of the weights of its levels.
+TIP_BOOST_WEIGHTS = {
+    'closest_city': 200,
+    'close_cities': 100,
+    'subregion': 50,
+    'region': 20,
+    'country': 10,
+}
+
+# Location resolution cache, coordinates are snapped to a grid of
+# LOCATION_GRID_SIZE degrees (about 1km with the default).
+LOCATION_GRID_SIZE = config('LOCATION_GRID_SIZE', cast=float, default=0.01)
+LOCATION_CACHE_SIZE = config('LOCATION_CACHE_SIZE', cast=int, default=10000)
+LOCATION_CACHE_TTL = config('LOCATION_CACHE_TTL', cast=int, default=3600)
+
+# Maximum number of tips created by one batch request
+TIP_BATCH_MAX_SIZE = 500
+
+# Votes are added to tip scores by batches of at most VOTE_FLUSH_BATCH_SIZE by
+# the ./manage.py apply_votes --loop worker, which checks for pending votes
+# every VOTE_FLUSH_INTERVAL seconds.
+VOTE_FLUSH_INTERVAL = config('VOTE_FLUSH_INTERVAL', cast=float, default=5)
+VOTE_FLUSH_BATCH_SIZE = 1000
+
+# Lifetime in seconds of the precomputed tip rankings, they are rebuilt on
+# tip changes and when expired.
+TIP_RANKING_CACHE_TTL = config('TIP_RANKING_CACHE_TTL', cast=int, default=600)
+
+# Number of top tips in the precomputed ranking of each requested location
+# and of the tips without location, the following pages are ranked by the
+# database.
+TIP_RANKING_SIZE = config('TIP_RANKING_SIZE', cast=int, default=100)
+
+# Time in seconds after which a ranking rebuild is assumed to have failed,
+# and another request may rebuild it. Until then, the other requests are
+# served the previous ranking.
+TIP_RANKING_LOCK_SECONDS = config('TIP_RANKING_LOCK_SECONDS', cast=int,
+                                  default=30)
+
+# Lifetime in seconds of the cached anonymous tip feed responses, they are
+# invalidated on tip changes.
+TIP_FEED_CACHE_TTL = config('TIP_FEED_CACHE_TTL', cast=int, default=300)
+
+# Lifetime in seconds of the cached map tile clusters, they are invalidated
+# on tip changes.
+TIP_CLUSTERS_CACHE_TTL = config('TIP_CLUSTERS_CACHE_TTL', cast=int,
+                                default=3600)
+
+# In-memory city index used instead of PostGIS for nearest city searches,
+# needs numpy and scipy. Workers check every CITY_INDEX_CHECK_INTERVAL
+# seconds whether ./manage.py refresh_city_index asked for a rebuild, which
+# requires a cache shared between workers.
+CITY_INDEX_ENABLED = config('CITY_INDEX_ENABLED', cast=bool, default=False)
+CITY_INDEX_CHECK_INTERVAL = config('CITY_INDEX_CHECK_INTERVAL', cast=int,
+                                   default=60)
+# Build the city indexes, including the typeahead name index which takes
+# about 200 bytes per city or area name, when the WSGI application is loaded
+# instead of in the first request using them.
+CITY_INDEX_PRELOAD = config('CITY_INDEX_PRELOAD', cast=bool, default=False)
+
+# City typeahead searches, cities further than CITY_TYPEAHEAD_DISTANCE_KM
+# from the given coordinates rank as if they had a fraction of their
+# population.
+CITY_TYPEAHEAD_LIMIT = 10
+CITY_TYPEAHEAD_MAX_LIMIT = 50
+CITY_TYPEAHEAD_DISTANCE_KM = 100
+
 # Email, use sendmail
 EMAIL_BACKEND = 'django_sendmail_backend.backends.EmailBackend'
 
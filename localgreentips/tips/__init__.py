@@ -0,0 +1 @@
+default_app_config = 'localgreentips.tips.apps.TipsConfig'
@@ -1,12 +1,52 @@
 from django.contrib import admin
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 
-from .models import Tip, Comment
+from .models import Tip, TipLocation, Vote, Comment
+
+
+def count_of(model):
+    """Subquery counting the rows of model related to each tip.
+    """
+    counts = model.objects.filter(tip=OuterRef('pk')).order_by().values(
+        'tip').annotate(count=Count('*')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()),
+                    Value(0))
 
 
 class TipAdmin(admin.ModelAdmin):
-    search_fields = ('cities__name', 'subregions__name',
+    list_display = ('title', 'tipper', 'score', 'location_count',
+                    'vote_count')
+    list_select_related = ('tipper',)
+    # Location choices are searched instead of listed, the searched name
+    # columns have trigram indexes.
+    autocomplete_fields = ('cities', 'subregions', 'regions', 'countries')
+    search_fields = ('title', 'cities__name', 'subregions__name',
                      'regions__name', 'countries__name')
 
+    def get_queryset(self, request):
+        # Counts are computed for the rows of the changelist page only.
+        return super().get_queryset(request).annotate(
+            location_count=count_of(TipLocation),
+            vote_count=count_of(Vote))
+
+    def location_count(self, tip):
+        return tip.location_count
+    location_count.admin_order_field = 'location_count'
+    location_count.short_description = 'locations'
+
+    def vote_count(self, tip):
+        return tip.vote_count
+    vote_count.admin_order_field = 'vote_count'
+    vote_count.short_description = 'votes'
+
+
+class VoteAdmin(admin.ModelAdmin):
+    list_display = ('tip', 'user', 'value', 'created', 'applied')
+    list_select_related = ('tip__tipper', 'user')
+    autocomplete_fields = ('tip', 'user')
+
 
 admin.site.register(Tip, TipAdmin)
 admin.site.register(Comment)
+admin.site.register(Vote, VoteAdmin)
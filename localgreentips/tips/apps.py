@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 
 class TipsConfig(AppConfig):
-    name = 'tips'
+    name = 'localgreentips.tips'
+    label = 'tips'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
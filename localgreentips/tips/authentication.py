@@ -0,0 +1,44 @@
+"""Token authentication with the token users kept in the cache.
+
+Tokens are looked up in the database once per TOKEN_CACHE_TTL instead of on
+every request. The cached entry of a token is deleted when the token is
+deleted, as on logout, or when its user is saved or deleted. This only
+reaches every worker through a shared cache, so tokens are not cached when
+the cache backend is local to each process.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from . import caching
+
+TOKEN_KEY_PREFIX = 'tips:token:'
+
+
+def get_token_cache_key(key):
+    return TOKEN_KEY_PREFIX + hashlib.md5(key.encode()).hexdigest()
+
+
+def invalidate_tokens(keys):
+    cache.delete_many([get_token_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication reading the token and its user from the cache.
+    """
+    def authenticate_credentials(self, key):
+        if not caching.is_shared():
+            return super().authenticate_credentials(key)
+        cache_key = get_token_cache_key(key)
+        credentials = cache.get(cache_key)
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            cache.set(cache_key, credentials, settings.TOKEN_CACHE_TTL)
+        user, token = credentials
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                'User inactive or deleted.')
+        return credentials
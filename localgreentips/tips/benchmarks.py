@@ -0,0 +1,235 @@
+"""Query count and latency benchmarks of the tips and cities APIs.
+
+Synthetic countries, regions, subregions, cities and tips are generated at
+a configurable scale, then each scenario is requested through the API while
+recording the number of queries, their time, the request latency and the
+rows scanned by the database. Run with ./manage.py benchmark_api.
+"""
+import logging
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from cities.models import Country, Region, Subregion, City
+
+from . import bulk, locations
+from .models import Tip
+from .serializers import LocationData
+
+logger = logging.getLogger(__name__)
+
+COUNTRIES = 5
+REGIONS_PER_COUNTRY = 10
+SUBREGIONS_PER_REGION = 5
+
+
+def generate_locations(cities_count, rng):
+    """Create a hierarchy of countries, regions, subregions and cities.
+
+    Each country covers a 10 by 10 degrees square, its cities are spread
+    randomly in it. Returns the created cities.
+    """
+    cities = []
+    per_country = max(1, cities_count // COUNTRIES)
+    for country_index in range(COUNTRIES):
+        # Country codes are unique.
+        country = Country.objects.create(
+            name="Country {}".format(country_index),
+            code="C{}".format(country_index),
+            code3="C{:02d}".format(country_index), population=1000000)
+        regions = Region.objects.bulk_create(
+            Region(name="Region {}.{}".format(country_index, index),
+                   country=country)
+            for index in range(REGIONS_PER_COUNTRY))
+        subregions = Subregion.objects.bulk_create(
+            Subregion(name="Subregion {}.{}".format(region.name, index),
+                      region=region)
+            for region in regions
+            for index in range(SUBREGIONS_PER_REGION))
+        origin = (country_index * 10 - 20, 40)
+        country_cities = []
+        for index in range(per_country):
+            subregion = rng.choice(subregions)
+            country_cities.append(City(
+                name="City {}.{}".format(country_index, index),
+                country=country, region=subregion.region,
+                subregion=subregion,
+                location=Point(origin[0] + rng.random() * 10,
+                               origin[1] + rng.random() * 10),
+                population=rng.randint(100, 1000000)))
+        cities += City.objects.bulk_create(country_cities)
+    locations.clear_cache()
+    return cities
+
+
+def random_location_data(cities, rng):
+    """Pick the locations of a tip, at a random level.
+    """
+    city = rng.choice(cities)
+    draw = rng.random()
+    if draw < 0.70:
+        return LocationData(rng.sample(cities, rng.randint(1, 3)), [], [], [])
+    if draw < 0.80:
+        return LocationData([], [city.subregion], [], [])
+    if draw < 0.90:
+        return LocationData([], [], [city.region], [])
+    if draw < 0.95:
+        return LocationData([], [], [], [city.country])
+    return LocationData([], [], [], [])
+
+
+def generate_tips(tips_count, cities, user, rng, chunk_size=5000):
+    created = 0
+    while created < tips_count:
+        count = min(chunk_size, tips_count - created)
+        bulk.create_tips([
+            (Tip(title="Tip {}".format(created + index),
+                 text="Synthetic benchmark tip.",
+                 score=rng.randint(0, 100), tipper=user),
+             random_location_data(cities, rng))
+            for index in range(count)], batch_size=1000)
+        created += count
+        logger.info("Generated %d tips", created)
+
+
+def percentile(values, ratio):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(ratio * len(values)))]
+
+
+def rows_scanned(queries):
+    """Sum the rows read by the scan nodes of the plans of SELECT queries.
+    """
+    def scanned(plan):
+        rows = 0
+        if plan['Node Type'].endswith('Scan'):
+            rows += plan.get('Actual Rows', 0) * plan.get('Actual Loops', 1)
+            rows += plan.get('Rows Removed by Filter', 0)
+        for child in plan.get('Plans', []):
+            rows += scanned(child)
+        return rows
+
+    total = 0
+    with connection.cursor() as cursor:
+        for query in queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            cursor.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + sql)
+            plan = cursor.fetchone()[0]
+            total += scanned(plan[0]['Plan'])
+    return total
+
+
+class Benchmark:
+    """Generate data then run the API scenarios.
+    """
+
+    def __init__(self, tips_count, cities_count, iterations, seed=0):
+        self.tips_count = tips_count
+        self.cities_count = cities_count
+        self.iterations = iterations
+        self.rng = random.Random(seed)
+
+    def setup(self):
+        self.user = User.objects.create_user("benchmark", password="secret")
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.auth_client = APIClient()
+        self.auth_client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+        start = time.monotonic()
+        self.cities = generate_locations(self.cities_count, self.rng)
+        generate_tips(self.tips_count, self.cities, self.user, self.rng)
+        self.setup_time = time.monotonic() - start
+
+    def random_position(self):
+        city = self.rng.choice(self.cities)
+        return {'longitude': city.location.x, 'latitude': city.location.y}
+
+    def tip_data(self):
+        city = self.rng.choice(self.cities)
+        return {
+            'title': 'Benchmark tip',
+            'text': 'Created during the benchmark.',
+            'cities': [{'id': city.id, 'name': city.name}],
+            'regions': [{'id': city.region.id, 'name': city.region.name}],
+            'countries': [{'id': city.country.id,
+                           'name': city.country.name}],
+        }
+
+    def scenarios(self):
+        """Yield (name, request function) of every scenario.
+
+        Caches are cleared before each request unless the name ends with
+        _cached, so that the other scenarios measure the full request.
+        """
+        yield 'tips_global', lambda: self.client.get('/tips/')
+        yield 'tips_global_cached', lambda: self.client.get('/tips/')
+        yield 'tips_local', lambda: self.client.get(
+            '/tips/', self.random_position())
+        yield 'tips_local_authenticated', lambda: self.auth_client.get(
+            '/tips/', self.random_position())
+
+        def next_page():
+            response = self.client.get('/tips/', self.random_position())
+            return self.client.get(response.data['next']) \
+                if response.data['next'] else response
+        yield 'tips_local_next_page', next_page
+
+        yield 'cities_nearest', lambda: self.client.get(
+            '/cities/', self.random_position())
+        yield 'tip_create', lambda: self.auth_client.post(
+            '/tips/', self.tip_data(), format='json')
+
+        tip_ids = list(Tip.objects.filter(tipper=self.user).values_list(
+            'pk', flat=True)[:self.iterations])
+        yield 'tip_update', lambda: self.auth_client.put(
+            '/tips/{}/'.format(self.rng.choice(tip_ids)), self.tip_data(),
+            format='json')
+
+    def run_scenario(self, name, request):
+        latencies = []
+        queries = []
+        queries_time = []
+        sample = None
+        for iteration in range(self.iterations):
+            if not name.endswith('_cached'):
+                cache.clear()
+                locations.clear_cache()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = request()
+                latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                raise RuntimeError("{} failed with {}: {}".format(
+                    name, response.status_code, response.content[:200]))
+            queries.append(len(context.captured_queries))
+            queries_time.append(sum(float(query['time'])
+                                    for query in context.captured_queries))
+            sample = context.captured_queries
+
+        return {
+            'iterations': self.iterations,
+            'queries': statistics.mean(queries),
+            'queries_max': max(queries),
+            'query_time_ms': statistics.mean(queries_time) * 1000,
+            'p50_ms': percentile(latencies, 0.5) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'rows_scanned': rows_scanned(sample),
+        }
+
+    def run(self):
+        results = {}
+        for name, request in self.scenarios():
+            results[name] = self.run_scenario(name, request)
+            logger.info("%s: %s", name, results[name])
+        return results
@@ -0,0 +1,152 @@
+"""Creation of many tips at once with a constant number of queries.
+"""
+import logging
+
+from django.db import transaction
+
+from . import caching
+from .models import Tip, TipLocation
+from .serializers import LOCATION_MODELS, LocationData
+
+logger = logging.getLogger(__name__)
+
+
+def create_tips(entries, batch_size=None):
+    """Create tips with their locations.
+
+    Entries are (tip, location_data) with unsaved Tip instances. Tips,
+    many to many links and the location index are inserted with bulk
+    queries in one transaction, then the caches depending on the locations
+    are invalidated. Returns the created tips.
+    """
+    if not entries:
+        return []
+
+    with transaction.atomic():
+        tips = Tip.objects.bulk_create(
+            [tip for tip, location_data in entries], batch_size=batch_size)
+
+        index_rows = []
+        links = {field: [] for level, field in TipLocation.LEVEL_FIELDS}
+        current = set()
+        has_global_tips = False
+        for tip, location_data in entries:
+            tip_locations = set()
+            for level, field in TipLocation.LEVEL_FIELDS:
+                m2m_field = Tip._meta.get_field(field)
+                through = m2m_field.remote_field.through
+                source = m2m_field.m2m_field_name() + '_id'
+                target = m2m_field.m2m_reverse_field_name() + '_id'
+                location_ids = {location.pk for location
+                                in getattr(location_data, field)}
+                for location_id in location_ids:
+                    links[field].append(through(**{
+                        source: tip.pk,
+                        target: location_id,
+                    }))
+                    index_rows.append(TipLocation(
+                        tip=tip, level=level, location_id=location_id))
+                    tip_locations.add((level, location_id))
+            current |= tip_locations
+            has_global_tips = has_global_tips or not tip_locations
+
+        for field, rows in links.items():
+            through = Tip._meta.get_field(field).remote_field.through
+            through.objects.bulk_create(rows, batch_size=batch_size)
+        TipLocation.objects.bulk_create(index_rows, batch_size=batch_size)
+
+    caching.bump_locations(current, has_global_tips)
+    logger.debug("Created %d tips in bulk", len(tips))
+    return tips
+
+
+class LocationResolver:
+    """Resolve location references of many tips in batches.
+
+    A reference is a location id, a name, or a dict with an id and/or a
+    name. Names are only resolved when they match a single location. Invalid
+    references are reported as errors by resolve().
+    """
+
+    def __init__(self, tips_data):
+        self.by_id = {}
+        self.by_name = {}
+        for name, model in LOCATION_MODELS:
+            ids = set()
+            names = set()
+            for data in tips_data:
+                for reference in self._references(data, name):
+                    location_id, location_name = self._split(reference)
+                    if location_id is not None:
+                        ids.add(location_id)
+                    elif location_name:
+                        names.add(location_name)
+            self.by_id[name] = \
+                model.objects.only('id', 'name').in_bulk(ids) if ids else {}
+            self.by_name[name] = {}
+            if names:
+                for location in model.objects.only('id', 'name').filter(
+                        name__in=names):
+                    self.by_name[name].setdefault(
+                        location.name, []).append(location)
+
+    @staticmethod
+    def _references(data, name):
+        references = data.get(name) or []
+        return references if isinstance(references, list) else []
+
+    @staticmethod
+    def _split(reference):
+        """Return the id and the name of a reference, both None if invalid.
+        """
+        if isinstance(reference, dict):
+            location_id = reference.get('id')
+            location_name = reference.get('name')
+            if location_id is None:
+                if not isinstance(location_name, str):
+                    location_name = None
+                return None, location_name
+        elif isinstance(reference, str) and not reference.isdigit():
+            return None, reference
+        else:
+            location_id, location_name = reference, None
+        if isinstance(location_id, bool) or \
+                not isinstance(location_id, (int, str)):
+            return None, None
+        try:
+            return int(location_id), location_name
+        except ValueError:
+            return None, None
+
+    def resolve(self, data):
+        """Return the LocationData of tip data, and a list of errors.
+        """
+        related = {}
+        errors = []
+        for name, model in LOCATION_MODELS:
+            related[name] = []
+            if not isinstance(data.get(name) or [], list):
+                errors.append("{} must be a list".format(name))
+                continue
+            for reference in self._references(data, name):
+                location_id, location_name = self._split(reference)
+                if location_id is None and not location_name:
+                    errors.append("invalid {} {!r}".format(
+                        model._meta.verbose_name, reference))
+                    continue
+                if location_id is not None:
+                    location = self.by_id[name].get(location_id)
+                    if location is None:
+                        errors.append("{} {} doesn't exist".format(
+                            model._meta.verbose_name, location_id))
+                        continue
+                else:
+                    matches = self.by_name[name].get(location_name, [])
+                    if len(matches) != 1:
+                        errors.append("{} {} matches {} locations".format(
+                            model._meta.verbose_name, location_name,
+                            len(matches)))
+                        continue
+                    location = matches[0]
+                related[name].append(location)
+        return LocationData(**related), errors
@@ -0,0 +1,197 @@
+"""Version counters of the tips attached to each location.
+
+Every tip write bumps the counters of the locations the tip was or is now
+attached to, or the global counter for tips without location. Anything
+derived from the tips of a location, like a cached feed response, is stored
+under a key built from the counters it depends on, so that a bump makes it
+unreachable without having to find and delete it.
+
+Counters are bumped once the transaction of the write is committed, so that
+a concurrent request can't store data read before the commit under the new
+versions. They only invalidate other processes through a cache shared by
+all of them, see is_shared.
+
+Versions also carry the WAL position of the default database when they were
+bumped, so that data read from a replica is only cached, or tagged, under
+versions whose writes the replica has replayed, see is_fresh.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_etags
+
+from . import routers
+from .models import TipLocation
+
+GLOBAL_VERSION_KEY = 'tips:version:global'
+# Bumped on any change of the tips of any location, for the map clusters.
+CLUSTERS_VERSION_KEY = 'tips:version:clusters'
+# Bumped on city changes and imports.
+CITIES_VERSION_KEY = 'tips:version:cities'
+FEED_KEY_PREFIX = 'tips:feed:'
+# Cache backends whose entries are only seen by the process storing them
+PROCESS_LOCAL_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+def is_shared():
+    """Whether the cache is shared by the processes serving requests.
+    """
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def location_version_key(level, location_id):
+    return 'tips:version:{}:{}'.format(level, location_id)
+
+
+def _new_version(position):
+    return '{}:{}'.format(position or 0, uuid.uuid4().hex)
+
+
+def _version_position(version):
+    position, _, token = version.partition(':')
+    return int(position) if token else 0
+
+
+def get_versions(keys):
+    """Return the current versions of the given counters.
+
+    Counters which were never bumped, or were evicted from the cache, are
+    given a fresh random version, at the current position of the default
+    database as the writes they counted are unknown.
+    """
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        position = routers.primary_position()
+    for key in missing:
+        cache.add(key, _new_version(position), None)
+    if missing:
+        versions.update(cache.get_many(missing))
+    return [versions.get(key) for key in keys]
+
+
+def bump_versions(keys):
+    """Bump counters when the current transaction, if any, is committed.
+    """
+    keys = list(keys)
+
+    def bump():
+        position = routers.primary_position()
+        cache.set_many({key: _new_version(position) for key in keys}, None)
+
+    transaction.on_commit(bump)
+
+
+def is_fresh(versions):
+    """Whether the reads of the request see the writes counted by versions.
+
+    It must be called before the reads, see routers.replica_position.
+    """
+    return routers.reads_include(
+        max((_version_position(version) for version in versions if version),
+            default=0))
+
+
+def bump_locations(locations, include_global=False):
+    """Bump the counters of a set of (level, location_id).
+    """
+    keys = [location_version_key(level, location_id)
+            for level, location_id in locations]
+    if include_global:
+        keys.append(GLOBAL_VERSION_KEY)
+    if locations:
+        keys.append(CLUSTERS_VERSION_KEY)
+    bump_versions(keys)
+
+
+def bump_tip_locations(previous, current):
+    """Bump the counters of a tip from its previous and current locations.
+
+    Locations are sets of (level, location_id), empty for a global tip.
+    """
+    bump_locations(previous | current, not previous or not current)
+
+
+def bump_tip(tip):
+    """Bump the counters of the current locations of a tip.
+    """
+    current = set(TipLocation.objects.filter(tip=tip).values_list(
+        'level', 'location_id'))
+    bump_tip_locations(current, current)
+
+
+def bump_tips(tip_ids):
+    """Bump the counters of the current locations of several tips.
+    """
+    tip_ids = set(tip_ids)
+    rows = TipLocation.objects.filter(tip__in=tip_ids).values_list(
+        'tip_id', 'level', 'location_id')
+    located = set()
+    current = set()
+    for tip_id, level, location_id in rows:
+        located.add(tip_id)
+        current.add((level, location_id))
+    bump_locations(current, bool(tip_ids - located))
+
+
+def location_dependencies(resolved):
+    """Counters the tip feed of a resolved location depends on.
+    """
+    keys = [GLOBAL_VERSION_KEY]
+    if resolved is None:
+        return keys
+    keys.append(location_version_key(
+        TipLocation.CITY, resolved.closest_city_id))
+    keys.extend(location_version_key(TipLocation.CITY, city_id)
+                for city_id in resolved.close_city_ids)
+    for level, location_id in (
+            (TipLocation.SUBREGION, resolved.subregion_id),
+            (TipLocation.REGION, resolved.region_id),
+            (TipLocation.COUNTRY, resolved.country_id)):
+        if location_id is not None:
+            keys.append(location_version_key(level, location_id))
+    return keys
+
+
+def get_feed_digest(resolved, *parts):
+    """Digest identifying a tip feed response for a resolved location.
+
+    Extra parts, like the page cursor, are added to the digest. It changes
+    whenever the tips the feed depends on change.
+    """
+    versions = get_versions(location_dependencies(resolved))
+    return hashlib.md5(
+        repr((resolved, parts, versions)).encode()).hexdigest()
+
+
+def get_feed_key(digest):
+    return FEED_KEY_PREFIX + digest
+
+
+def get_cities_digest(*parts):
+    """Digest identifying a cities response, changing with the cities.
+    """
+    versions = get_versions([CITIES_VERSION_KEY])
+    return hashlib.md5(repr((parts, versions)).encode()).hexdigest()
+
+
+def bump_cities():
+    bump_versions([CITIES_VERSION_KEY])
+
+
+def etag_matches(request, etag):
+    """Whether the If-None-Match header of request matches etag.
+    """
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return etag in etags or '*' in etags
+
+
+def get_feed(key):
+    return cache.get(key)
+
+
+def set_feed(key, data):
+    cache.set(key, data, settings.TIP_FEED_CACHE_TTL)
@@ -0,0 +1,18 @@
+"""System checks of the deployment settings.
+"""
+from django.core import checks
+
+from . import caching
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if caching.is_shared():
+        return []
+    return [checks.Error(
+        "The cache backend is local to each process, so tip writes don't "
+        "invalidate the feeds, rankings and ETags of the other processes.",
+        hint="Set CACHE_BACKEND and CACHE_LOCATION to a cache shared by "
+             "every process, like memcached, when running several workers.",
+        id='tips.E001',
+    )]
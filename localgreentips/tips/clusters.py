@@ -0,0 +1,163 @@
+"""Tip counts of map tiles, for zoomed out map views.
+
+Tiles follow the usual web map scheme: at a zoom level the world is split in
+2**zoom by 2**zoom tiles, numbered from the top left corner. Tips of the
+locations of a tile are counted by region, subregion, grid cell or city
+depending on the zoom, from the TipLocation index, so that tips attached to
+a region or a subregion are counted as well as city tips.
+"""
+import math
+
+from django.conf import settings
+from django.contrib.gis.geos import Polygon
+from django.core.cache import cache
+from django.db.models import (
+    Avg, Case, Count, ExpressionWrapper, F, FloatField, Func, IntegerField,
+    OuterRef, Q, Subquery, Value, When)
+from django.db.models.functions import Cast, Least
+
+from cities.models import City, Subregion
+
+from . import caching
+from .models import TipLocation
+
+MAX_ZOOM = 20
+# Clustering of each zoom level, up to the given zoom.
+ZOOM_LEVELS = (
+    (4, 'region'),
+    (7, 'subregion'),
+    (10, 'grid'),
+    (MAX_ZOOM, 'city'),
+)
+# Grid cells along each side of a tile
+GRID_CELLS = 8
+CLUSTERS_KEY_PREFIX = 'tips:clusters:'
+
+
+def get_level(zoom):
+    for max_zoom, level in ZOOM_LEVELS:
+        if zoom <= max_zoom:
+            return level
+
+
+def tile_bbox(zoom, x, y):
+    """Return the (min lon, min lat, max lon, max lat) of a tile.
+    """
+    tiles = 2 ** zoom
+
+    def latitude(tile_y):
+        return math.degrees(math.atan(math.sinh(
+            math.pi * (1 - 2 * tile_y / tiles))))
+
+    return (x / tiles * 360 - 180, latitude(y + 1),
+            (x + 1) / tiles * 360 - 180, latitude(y))
+
+
+def _coordinate(function):
+    return Func(F('location'), function=function, output_field=FloatField())
+
+
+def _cell(function, low, high):
+    """Index of the grid cell of a coordinate, along one side of a tile.
+    """
+    cell = Cast(Func(
+        (_coordinate(function) - low) * GRID_CELLS / (high - low),
+        function='FLOOR', output_field=FloatField()), IntegerField())
+    return Least(cell, Value(GRID_CELLS - 1))
+
+
+def _city_key(level, bbox):
+    """Expression of the cluster of a city, for a clustering level.
+    """
+    if level == 'grid':
+        return ExpressionWrapper(
+            _cell('ST_X', bbox[0], bbox[2]) * GRID_CELLS +
+            _cell('ST_Y', bbox[1], bbox[3]),
+            output_field=IntegerField())
+    if level == 'city':
+        return F('pk')
+    return F(level + '_id')
+
+
+def compute_clusters(zoom, x, y):
+    """Count the tips of the locations of a tile, grouped for its zoom.
+
+    Tips of the cities of the tile are counted in the cluster of their
+    city. At the region and subregion levels, tips of the areas having
+    cities in the tile are also counted in the cluster of the area. Tips
+    are counted once per cluster, in one grouped query over the location
+    index, and clusters are placed at the mean position of their cities.
+    """
+    level = get_level(zoom)
+    bbox = tile_bbox(zoom, x, y)
+    polygon = Polygon.from_bbox(bbox)
+    polygon.srid = 4326
+    cities = City.objects.filter(location__within=polygon).annotate(
+        key=_city_key(level, bbox))
+
+    keys = [When(level=TipLocation.CITY, then=Subquery(
+        cities.filter(pk=OuterRef('location_id')).values('key')[:1]))]
+    covered = Q(level=TipLocation.CITY, location_id__in=cities.values('pk'))
+    if level == 'subregion':
+        keys.append(When(level=TipLocation.SUBREGION, then=F('location_id')))
+    elif level == 'region':
+        keys.append(When(level=TipLocation.SUBREGION, then=Subquery(
+            Subregion.objects.filter(pk=OuterRef('location_id')).values(
+                'region_id')[:1])))
+        keys.append(When(level=TipLocation.REGION, then=F('location_id')))
+        covered |= Q(level=TipLocation.REGION,
+                     location_id__in=cities.values('region_id'))
+    if level in ('subregion', 'region'):
+        covered |= Q(level=TipLocation.SUBREGION,
+                     location_id__in=cities.values('subregion_id'))
+
+    counts = dict(TipLocation.objects.filter(covered).annotate(
+        key=Case(*keys, output_field=IntegerField()),
+    ).values('key').annotate(
+        count=Count('tip', distinct=True),
+    ).order_by().values_list('key', 'count'))
+    counts.pop(None, None)
+
+    placed = cities.filter(key__in=list(counts))
+    if level == 'grid':
+        # Cells are placed at the mean position of their cities with tips.
+        placed = placed.filter(pk__in=TipLocation.objects.filter(
+            level=TipLocation.CITY).values('location_id'))
+        name_field = None
+    elif level == 'city':
+        name_field = 'name'
+    else:
+        name_field = level + '__name'
+    fields = ('key', name_field) if name_field else ('key',)
+    rows = placed.values(*fields).annotate(
+        longitude=Avg(_coordinate('ST_X')),
+        latitude=Avg(_coordinate('ST_Y')),
+    ).order_by()
+
+    clusters = []
+    for row in rows:
+        cluster = {
+            'count': counts[row['key']],
+            'longitude': row['longitude'],
+            'latitude': row['latitude'],
+        }
+        if name_field:
+            cluster['id'] = row['key']
+            cluster['name'] = row[name_field]
+        clusters.append(cluster)
+    clusters.sort(key=lambda cluster: -cluster['count'])
+    return {'level': level, 'clusters': clusters}
+
+
+def get_clusters(zoom, x, y):
+    """Return the clusters of a tile, from the cache when tips are unchanged.
+    """
+    version, = caching.get_versions([caching.CLUSTERS_VERSION_KEY])
+    key = '{}{}:{}:{}:{}'.format(CLUSTERS_KEY_PREFIX, zoom, x, y, version)
+    data = cache.get(key)
+    if data is None:
+        fresh = caching.is_fresh([version])
+        data = compute_clusters(zoom, x, y)
+        if fresh:
+            cache.set(key, data, settings.TIP_CLUSTERS_CACHE_TTL)
+    return data
@@ -0,0 +1,78 @@
+"""In-memory indexes kept by each worker, and the distances they need.
+
+A WorkerIndex builds its index the first time it is needed. Every
+CITY_INDEX_CHECK_INTERVAL seconds it checks whether the version shared by
+the workers in the cache was bumped by refresh(), and if so rebuilds it.
+"""
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import routers
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(longitude1, latitude1, longitude2, latitude2):
+    """Great-circle distance in km between two positions.
+    """
+    longitude1, latitude1, longitude2, latitude2 = map(
+        math.radians, (longitude1, latitude1, longitude2, latitude2))
+    a = (math.sin((latitude2 - latitude1) / 2) ** 2 +
+         math.cos(latitude1) * math.cos(latitude2) *
+         math.sin((longitude2 - longitude1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1, math.sqrt(a)))
+
+
+class WorkerIndex:
+    """Index of this worker, built by build() and shared by its threads.
+    """
+    def __init__(self, name, version_key, build):
+        self.name = name
+        self.version_key = version_key
+        self.build = build
+        self._index = None
+        self._version = None
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the index, built or rebuilt when needed.
+        """
+        now = time.monotonic()
+        index = self._index
+        if index is not None and \
+                now - self._checked < settings.CITY_INDEX_CHECK_INTERVAL:
+            return index
+
+        with self._lock:
+            version = cache.get(self.version_key, 0)
+            if self._index is None or version != self._version:
+                start = time.monotonic()
+                with routers.use_default():
+                    self._index = self.build()
+                self._version = version
+                logger.info("Built %s of %d entries in %.2fs", self.name,
+                            len(self._index), time.monotonic() - start)
+            self._checked = now
+            return self._index
+
+    def invalidate(self):
+        """Drop the index of this worker, it is rebuilt on next use.
+        """
+        self._index = None
+
+    def refresh(self):
+        """Make every worker rebuild its index, for instance after an import.
+        """
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, 1, None)
+        self.invalidate()
@@ -0,0 +1,174 @@
+"""Resolution of coordinates to the cities around them.
+
+Coordinates are snapped to a regular grid and the cities found around the
+centre of each grid cell are kept in a bounded in-process cache, so that
+repeated lookups from the same area don't reach PostGIS.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import Point, Polygon
+from django.contrib.gis.measure import D
+from django.db.models import F, FloatField, Func
+
+from cities.models import City
+
+from . import spatial
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Thread safe least recently used cache with expiring entries.
+    """
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ResolvedLocation(namedtuple('ResolvedLocation', (
+        'closest_city_id', 'close_city_ids',
+        'subregion_id', 'region_id', 'country_id'))):
+    """Ids of the cities around a position and of the closest city parents.
+    """
+
+
+_cache = LRUCache(settings.LOCATION_CACHE_SIZE, settings.LOCATION_CACHE_TTL)
+
+
+def get_cell(longitude, latitude):
+    """Return the grid cell containing the given coordinates.
+    """
+    size = settings.LOCATION_GRID_SIZE
+    return (math.floor(longitude / size), math.floor(latitude / size))
+
+
+def get_cell_center(cell):
+    size = settings.LOCATION_GRID_SIZE
+    return Point((cell[0] + 0.5) * size, (cell[1] + 0.5) * size)
+
+
+def nearby_city_ids(longitude, latitude, radius_km, limit=None):
+    """Ids of the cities within radius_km of a position, closest first.
+
+    Distances are measured from the centre of the grid cell containing the
+    position, which is what allows results to be shared across requests.
+    The in-memory city index is used when enabled, PostGIS otherwise.
+    """
+    cell = get_cell(longitude, latitude)
+    key = ('nearby', cell, radius_km, limit)
+    city_ids = _cache.get(key)
+    if city_ids is not None:
+        return city_ids
+
+    center = get_cell_center(cell)
+    index = spatial.get_index()
+    if index is not None:
+        city_ids = tuple(pk for pk, distance in index.nearest(
+            center.x, center.y, radius_km, limit))
+    else:
+        cities = City.objects.filter(
+            location__distance_lte=(center, D(km=radius_km))).annotate(
+                distance=Distance('location', center)).order_by('distance')
+        if limit is not None:
+            cities = cities[:limit]
+        city_ids = tuple(cities.values_list('pk', flat=True))
+    logger.debug("Resolved cities near cell %s: %s", cell, city_ids)
+    _cache.set(key, city_ids)
+    return city_ids
+
+
+def resolve_location(longitude, latitude):
+    """Resolve a position to its closest city and the cities around it.
+
+    Returns a ResolvedLocation, or None if there is no city nearby.
+    """
+    cell = get_cell(longitude, latitude)
+    key = ('resolved', cell)
+    resolved = _cache.get(key)
+    if resolved is None:
+        city_ids = nearby_city_ids(
+            longitude, latitude,
+            settings.TIP_NEARBY_RADIUS_KM, settings.TIP_NEARBY_CITIES)
+        if not city_ids:
+            resolved = False
+        else:
+            closest_city_id = city_ids[0]
+            subregion_id, region_id, country_id = City.objects.values_list(
+                'subregion_id', 'region_id', 'country_id').get(
+                    pk=closest_city_id)
+            resolved = ResolvedLocation(
+                closest_city_id, city_ids[1:],
+                subregion_id, region_id, country_id)
+        _cache.set(key, resolved)
+    return resolved or None
+
+
+def cities_in_area(bbox=None, center=None, radius_km=None, limit=None):
+    """Cities inside a bounding box or a circle, most populated first.
+
+    The bounding box is (min longitude, min latitude, max longitude, max
+    latitude), the circle a center Point and a radius_km. Returns tuples of
+    (id, longitude, latitude, subregion id).
+    """
+    cities = City.objects.all()
+    if bbox is not None:
+        polygon = Polygon.from_bbox(bbox)
+        polygon.srid = 4326
+        cities = cities.filter(location__within=polygon)
+    if center is not None:
+        cities = cities.filter(
+            location__distance_lte=(center, D(km=radius_km)))
+    cities = cities.annotate(
+        longitude=Func(F('location'), function='ST_X',
+                       output_field=FloatField()),
+        latitude=Func(F('location'), function='ST_Y',
+                      output_field=FloatField()),
+    ).order_by('-population', 'pk')
+    if limit is not None:
+        cities = cities[:limit]
+    return list(cities.values_list(
+        'pk', 'longitude', 'latitude', 'subregion_id'))
+
+
+def clear_cache():
+    """Forget every resolved location, for instance after a cities import.
+    """
+    _cache.clear()
@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from localgreentips.tips import votes
+
+
+class Command(BaseCommand):
+    help = "Apply the pending votes to the tip scores."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', type=float, nargs='?', metavar='SECONDS',
+            const=settings.VOTE_FLUSH_INTERVAL,
+            help="Keep applying votes, waiting SECONDS, by default "
+                 "VOTE_FLUSH_INTERVAL, when none are pending.")
+
+    def handle(self, *args, **options):
+        while True:
+            applied = votes.apply_votes()
+            if applied:
+                self.stdout.write("Applied {} votes.".format(applied))
+            elif not options['loop']:
+                return
+            if options['loop'] and not applied:
+                time.sleep(options['loop'])
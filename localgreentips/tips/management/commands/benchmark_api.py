@@ -0,0 +1,77 @@
+import json
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from localgreentips.tips.benchmarks import Benchmark
+
+
+def get_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the tips and cities APIs on synthetic data, in a "
+            "test database, and write the results as JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tips', type=int, default=10000)
+        parser.add_argument('--cities', type=int, default=1000)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--compare',
+                            help="Previous results to compare with.")
+
+    def handle(self, *args, **options):
+        benchmark = Benchmark(options['tips'], options['cities'],
+                              options['iterations'], options['seed'])
+
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        old_config = runner.setup_databases()
+        try:
+            with override_settings(DEBUG=False):
+                benchmark.setup()
+                scenarios = benchmark.run()
+        finally:
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
+
+        results = {
+            'revision': get_revision(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'scale': {
+                'tips': options['tips'],
+                'cities': options['cities'],
+            },
+            'setup_s': benchmark.setup_time,
+            'scenarios': scenarios,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+        self.stdout.write("Results written to {}".format(options['output']))
+
+        previous = None
+        if options['compare']:
+            with open(options['compare']) as previous_file:
+                previous = json.load(previous_file)['scenarios']
+        for name, result in scenarios.items():
+            line = "{:<28} {:>6.1f} queries {:>8.2f}ms p50 {:>8.2f}ms p99 " \
+                   "{:>9} rows".format(name, result['queries'],
+                                       result['p50_ms'], result['p99_ms'],
+                                       result['rows_scanned'])
+            if previous and name in previous:
+                line += "  ({:+.1f} queries, {:+.0%} p50)".format(
+                    result['queries'] - previous[name]['queries'],
+                    result['p50_ms'] / previous[name]['p50_ms'] - 1)
+            self.stdout.write(line)
@@ -0,0 +1,93 @@
+import csv
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+
+from localgreentips.tips.models import Tip
+from localgreentips.tips.serializers import LOCATION_MODELS
+
+FIELDS = ('title', 'text', 'score', 'tipper') + tuple(
+    name for name, model in LOCATION_MODELS)
+
+
+def get_format(path, tips_format):
+    if tips_format:
+        return tips_format
+    if path.endswith('.csv'):
+        return 'csv'
+    if path.endswith(('.ndjson', '.jsonl')) or path == '-':
+        return 'ndjson'
+    raise CommandError("Unknown format of {}, use --format.".format(path))
+
+
+class Command(BaseCommand):
+    help = "Export tips to a NDJSON or CSV file, in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Output file, - for stdout.")
+        parser.add_argument('--format', choices=('ndjson', 'csv'))
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def iter_chunks(self, chunk_size):
+        """Yield tips by chunks, paginating on the primary key.
+        """
+        queryset = Tip.objects.defer('search_vector').select_related('tipper')
+        queryset = queryset.prefetch_related(*(
+            Prefetch(name, queryset=model.objects.only('id', 'name'))
+            for name, model in LOCATION_MODELS)).order_by('pk')
+        last_pk = 0
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                return
+            yield chunk
+            last_pk = chunk[-1].pk
+
+    def to_dict(self, tip):
+        data = {
+            'title': tip.title,
+            'text': tip.text,
+            'score': tip.score,
+            'tipper': tip.tipper.username if tip.tipper else None,
+        }
+        for name, model in LOCATION_MODELS:
+            data[name] = [{'id': location.id, 'name': location.name}
+                          for location in getattr(tip, name).all()]
+        return data
+
+    def handle(self, *args, **options):
+        path = options['path']
+        tips_format = get_format(path, options['format'])
+        output = sys.stdout if path == '-' else open(
+            path, 'w', newline='', encoding='utf-8')
+
+        start = time.monotonic()
+        count = 0
+        try:
+            if tips_format == 'csv':
+                writer = csv.DictWriter(output, fieldnames=FIELDS)
+                writer.writeheader()
+            for chunk in self.iter_chunks(options['chunk_size']):
+                for tip in chunk:
+                    data = self.to_dict(tip)
+                    if tips_format == 'csv':
+                        for name, model in LOCATION_MODELS:
+                            data[name] = ';'.join(
+                                str(location['id'])
+                                for location in data[name])
+                        data['tipper'] = data['tipper'] or ''
+                        writer.writerow(data)
+                    else:
+                        output.write(json.dumps(data) + '\n')
+                count += len(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        elapsed = time.monotonic() - start
+        report = self.stderr if path == '-' else self.stdout
+        report.write("Exported {} tips in {:.1f}s ({:.0f} rows/s).".format(
+            count, elapsed, count / elapsed if elapsed else 0))
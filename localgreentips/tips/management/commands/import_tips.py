@@ -0,0 +1,141 @@
+import csv
+import itertools
+import json
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from localgreentips.tips import bulk
+from localgreentips.tips.models import Tip
+from localgreentips.tips.serializers import LOCATION_MODELS
+
+from .export_tips import get_format
+
+TITLE_MAX_LENGTH = Tip._meta.get_field('title').max_length
+# Bounds of the integer column of the scores
+SCORE_MIN = -2 ** 31
+SCORE_MAX = 2 ** 31 - 1
+
+
+class Command(BaseCommand):
+    help = ("Import tips from a NDJSON or CSV file, in chunks. Locations are "
+            "given by id or by name, tippers by username.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, - for stdin.")
+        parser.add_argument('--format', choices=('ndjson', 'csv'))
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def iter_rows(self, input_file, tips_format):
+        if tips_format == 'csv':
+            for row in csv.DictReader(input_file):
+                for name, model in LOCATION_MODELS:
+                    row[name] = [reference.strip() for reference
+                                 in (row.get(name) or '').split(';')
+                                 if reference.strip()]
+                yield row
+        else:
+            for line in input_file:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError as error:
+                        # Reported as the error of the row
+                        yield error
+
+    def skip_row(self, number, errors):
+        self.stderr.write("Skipping row {}: {}".format(
+            number, ", ".join(errors)))
+
+    def get_tip(self, row, tippers):
+        """Return the unsaved tip of a row, and a list of errors.
+        """
+        errors = []
+        title = row.get('title')
+        text = row.get('text')
+        if not (title and isinstance(title, str) and
+                text and isinstance(text, str)):
+            errors.append("title and text are required")
+        elif len(title) > TITLE_MAX_LENGTH:
+            errors.append("title is longer than {} characters".format(
+                TITLE_MAX_LENGTH))
+
+        score = row.get('score') or 0
+        try:
+            score = int(score)
+        except (TypeError, ValueError):
+            errors.append("invalid score {!r}".format(score))
+        else:
+            if not SCORE_MIN <= score <= SCORE_MAX:
+                errors.append("score {} out of range".format(score))
+
+        tipper = row.get('tipper')
+        if tipper and (not isinstance(tipper, str) or tipper not in tippers):
+            errors.append("unknown tipper {}".format(tipper))
+        if errors:
+            return None, errors
+        return Tip(title=title, text=text, score=score,
+                   tipper=tippers.get(tipper)), errors
+
+    def import_chunk(self, rows, first_row):
+        """Create the tips of a chunk of rows, returns the number created.
+        """
+        numbered = []
+        for number, row in enumerate(rows, first_row):
+            if isinstance(row, ValueError):
+                self.skip_row(number, ["invalid JSON: {}".format(row)])
+            elif not isinstance(row, dict):
+                self.skip_row(number, ["expected an object"])
+            else:
+                numbered.append((number, row))
+
+        rows = [row for number, row in numbered]
+        resolver = bulk.LocationResolver(rows)
+        usernames = {row['tipper'] for row in rows
+                     if row.get('tipper') and isinstance(row['tipper'], str)}
+        tippers = User.objects.in_bulk(usernames, field_name='username') \
+            if usernames else {}
+
+        entries = []
+        for number, row in numbered:
+            location_data, errors = resolver.resolve(row)
+            tip, tip_errors = self.get_tip(row, tippers)
+            errors.extend(tip_errors)
+            if errors:
+                self.skip_row(number, errors)
+                continue
+            entries.append((tip, location_data))
+
+        return len(bulk.create_tips(entries))
+
+    def handle(self, *args, **options):
+        path = options['path']
+        tips_format = get_format(path, options['format'])
+        chunk_size = options['chunk_size']
+        input_file = sys.stdin if path == '-' else open(
+            path, newline='', encoding='utf-8')
+
+        start = time.monotonic()
+        count = 0
+        number = 1
+        try:
+            rows = self.iter_rows(input_file, tips_format)
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                count += self.import_chunk(chunk, number)
+                number += len(chunk)
+                if options['verbosity'] > 1:
+                    elapsed = time.monotonic() - start
+                    self.stderr.write("{} tips imported ({:.0f} rows/s)".format(
+                        count, count / elapsed if elapsed else 0))
+        finally:
+            if input_file is not sys.stdin:
+                input_file.close()
+
+        elapsed = time.monotonic() - start
+        self.stdout.write("Imported {} tips in {:.1f}s ({:.0f} rows/s).".format(
+            count, elapsed, count / elapsed if elapsed else 0))
@@ -0,0 +1,84 @@
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from localgreentips.tips.benchmarks import percentile
+
+DEFAULT_PATHS = (
+    '/tips/',
+    '/tips/?longitude=2.35&latitude=48.85',
+    '/cities/?longitude=2.35&latitude=48.85',
+)
+
+
+class Command(BaseCommand):
+    help = ("Send concurrent GET requests to a running server and report "
+            "its throughput and latencies, to compare deployments.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help="Server base URL.")
+        parser.add_argument('--path', action='append', dest='paths',
+                            help="Path to request, can be repeated.")
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--output',
+                            help="Write the results as JSON to this file.")
+        parser.add_argument('--compare',
+                            help="Previous results to compare with.")
+
+    def handle(self, *args, **options):
+        base_url = options['url'].rstrip('/')
+        paths = options['paths'] or DEFAULT_PATHS
+        urls = [base_url + paths[index % len(paths)]
+                for index in range(options['requests'])]
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=options['concurrency'])
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        def fetch(url):
+            start = time.perf_counter()
+            try:
+                response = session.get(url)
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            return ok, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            responses = list(executor.map(fetch, urls))
+        duration = time.perf_counter() - start
+
+        latencies = [latency for ok, latency in responses]
+        errors = sum(1 for ok, latency in responses if not ok)
+        if errors == len(responses):
+            raise CommandError("All requests to {} failed.".format(base_url))
+        results = {
+            'url': base_url,
+            'concurrency': options['concurrency'],
+            'requests': len(responses),
+            'errors': errors,
+            'requests_per_s': len(responses) / duration,
+            'mean_ms': statistics.mean(latencies) * 1000,
+            'p50_ms': percentile(latencies, 0.5) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+
+        line = ("{requests_per_s:.1f} requests/s {p50_ms:.2f}ms p50 "
+                "{p99_ms:.2f}ms p99 {errors} errors".format(**results))
+        if options['compare']:
+            with open(options['compare']) as previous_file:
+                previous = json.load(previous_file)
+            line += "  ({:+.0%} requests/s, {:+.0%} p99)".format(
+                results['requests_per_s'] / previous['requests_per_s'] - 1,
+                results['p99_ms'] / previous['p99_ms'] - 1)
+        self.stdout.write(line)
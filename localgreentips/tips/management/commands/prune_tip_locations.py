@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from localgreentips.tips import caching
+from localgreentips.tips.models import TipLocation
+
+
+class Command(BaseCommand):
+    help = ("Remove the tip location index rows of locations which do not "
+            "exist anymore, for instance after a raw cities import.")
+
+    def handle(self, *args, **options):
+        removed = TipLocation.prune()
+        if removed:
+            # Tips may have lost their last location and became global.
+            caching.bump_versions([caching.GLOBAL_VERSION_KEY,
+                                   caching.CLUSTERS_VERSION_KEY])
+        self.stdout.write("Removed {} tip location links.".format(removed))
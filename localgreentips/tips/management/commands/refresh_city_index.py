@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from localgreentips.tips import caching, locations, spatial, typeahead
+
+
+class Command(BaseCommand):
+    help = "Rebuild the in-memory city indexes of every worker."
+
+    def handle(self, *args, **options):
+        spatial.refresh_index()
+        typeahead.refresh_index()
+        locations.clear_cache()
+        caching.bump_cities()
+        if spatial.is_enabled():
+            index = spatial.get_index()
+            self.stdout.write("City index rebuilt with {} cities.".format(
+                len(index)))
+        else:
+            self.stdout.write("City index is disabled, "
+                              "set CITY_INDEX_ENABLED to use it.")
@@ -0,0 +1,54 @@
+# Generated by Django 2.1.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+LEVEL_FIELDS = (
+    (0, 'cities', 'city_id'),
+    (1, 'subregions', 'subregion_id'),
+    (2, 'regions', 'region_id'),
+    (3, 'countries', 'country_id'),
+)
+
+
+def populate_tip_locations(apps, schema_editor):
+    Tip = apps.get_model('tips', 'Tip')
+    TipLocation = apps.get_model('tips', 'TipLocation')
+    db_alias = schema_editor.connection.alias
+
+    for level, field, column in LEVEL_FIELDS:
+        through = getattr(Tip, field).through
+        links = through.objects.using(db_alias).values_list('tip_id', column)
+        TipLocation.objects.using(db_alias).bulk_create(
+            (TipLocation(tip_id=tip_id, level=level, location_id=location_id)
+             for tip_id, location_id in links.iterator()),
+            batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tips', '0005_tip_subregions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TipLocation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.PositiveSmallIntegerField(choices=[(0, 'city'), (1, 'subregion'), (2, 'region'), (3, 'country')])),
+                ('location_id', models.IntegerField()),
+                ('tip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='locations', to='tips.Tip')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='tiplocation',
+            index=models.Index(fields=['level', 'location_id', 'tip'], name='tips_tiploc_level_loc_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='tiplocation',
+            unique_together={('tip', 'level', 'location_id')},
+        ),
+        migrations.RunPython(populate_tip_locations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 2.1.7 on 2026-10-18 15:21
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+CREATE_TRIGGER = """
+CREATE FUNCTION tips_tip_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.text, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tips_tip_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, text, search_vector ON tips_tip
+    FOR EACH ROW EXECUTE PROCEDURE tips_tip_search_vector_update();
+
+UPDATE tips_tip SET search_vector = NULL;
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER tips_tip_search_vector_trigger ON tips_tip;
+DROP FUNCTION tips_tip_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tips', '0007_vote'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tip',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='tip',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='tips_tip_search_idx'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+    ]
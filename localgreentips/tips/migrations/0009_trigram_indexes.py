@@ -0,0 +1,46 @@
+# Generated by Django 2.1.7 on 2026-10-18 17:02
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Columns searched by the admin with icontains, which compares upper cased
+# values, so the trigram indexes are on the upper cased columns.
+TRIGRAM_INDEXES = (
+    ('tips_tip', 'title'),
+    ('cities_city', 'name'),
+    ('cities_city', 'name_std'),
+    ('cities_subregion', 'name'),
+    ('cities_subregion', 'name_std'),
+    ('cities_region', 'name'),
+    ('cities_region', 'name_std'),
+    ('cities_country', 'name'),
+)
+
+
+def index_name(table, column):
+    return '{}_{}_upper_trgm'.format(table, column)
+
+
+CREATE_INDEXES = [
+    'CREATE INDEX {} ON {} USING gin (UPPER({}) gin_trgm_ops);'.format(
+        index_name(table, column), table, column)
+    for table, column in TRIGRAM_INDEXES
+]
+
+DROP_INDEXES = [
+    'DROP INDEX {};'.format(index_name(table, column))
+    for table, column in TRIGRAM_INDEXES
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cities', '0011_auto_20180108_0706'),
+        ('tips', '0008_tip_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunSQL(CREATE_INDEXES, DROP_INDEXES),
+    ]
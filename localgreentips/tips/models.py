@@ -1,4 +1,7 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed
 from django.contrib.auth.models import User
 from cities.models import Country, Region, Subregion, City
 
@@ -19,6 +22,17 @@ class Tip(models.Model):
     subregions = models.ManyToManyField(Subregion, blank=True)
     countries = models.ManyToManyField(Country, blank=True)
 
+    # Weighted title and text, kept up to date by a database trigger.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Text search configuration of search_vector
+    SEARCH_CONFIG = 'english'
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='tips_tip_search_idx'),
+        ]
+
     def __str__(self):
         return "{} by {}".format(self.title, self.tipper)
 
@@ -30,3 +44,227 @@ class Comment(models.Model):
             on_delete=models.CASCADE,
             null=True,
     )
+
+
+class TipLocation(models.Model):
+    """Denormalized index of the locations a tip is attached to.
+
+    Each row mirrors one entry of the tip cities, subregions, regions or
+    countries, tagged with the level it sits at, so that tips can be looked
+    up and ranked by location with a single indexed query.
+    """
+    CITY = 0
+    SUBREGION = 1
+    REGION = 2
+    COUNTRY = 3
+    LEVEL_CHOICES = (
+        (CITY, 'city'),
+        (SUBREGION, 'subregion'),
+        (REGION, 'region'),
+        (COUNTRY, 'country'),
+    )
+    # Tip many to many field of each level
+    LEVEL_FIELDS = (
+        (CITY, 'cities'),
+        (SUBREGION, 'subregions'),
+        (REGION, 'regions'),
+        (COUNTRY, 'countries'),
+    )
+
+    tip = models.ForeignKey(
+        Tip,
+        related_name='locations',
+        on_delete=models.CASCADE,
+    )
+    level = models.PositiveSmallIntegerField(choices=LEVEL_CHOICES)
+    location_id = models.IntegerField()
+
+    class Meta:
+        unique_together = ('tip', 'level', 'location_id')
+        indexes = [
+            models.Index(fields=['level', 'location_id', 'tip'],
+                         name='tips_tiploc_level_loc_idx'),
+        ]
+
+    def __str__(self):
+        return "{} in {} {}".format(
+            self.tip_id, self.get_level_display(), self.location_id)
+
+    @classmethod
+    def sync(cls, tip, location_data):
+        """Update the index rows of a tip to match its location data.
+
+        Only the rows which changed are deleted or inserted. Returns the
+        previous and current sets of (level, location_id) of the tip.
+        """
+        wanted = set()
+        for level, field in cls.LEVEL_FIELDS:
+            wanted.update((level, item.pk)
+                          for item in getattr(location_data, field))
+
+        existing = set(cls.objects.filter(tip=tip).values_list(
+            'level', 'location_id'))
+
+        removed = existing - wanted
+        if removed:
+            query = models.Q()
+            for level, location_id in removed:
+                query |= models.Q(level=level, location_id=location_id)
+            cls.objects.filter(query, tip=tip).delete()
+
+        added = wanted - existing
+        if added:
+            cls.objects.bulk_create(
+                cls(tip=tip, level=level, location_id=location_id)
+                for level, location_id in added)
+
+        return existing, wanted
+
+    @classmethod
+    def update_tip(cls, tip, location_data):
+        """Set the locations of a tip, in its index and many to many fields.
+
+        Each many to many field is compared with the location data, so that
+        only the links which changed are deleted or inserted, then the index
+        is synced, in one transaction. The m2m_changed signals are marked so
+        that the receivers leave the index alone. Returns the previous and
+        current sets of (level, location_id), previous holding the locations
+        of both the links and the index.
+        """
+        with transaction.atomic():
+            linked = set()
+            for level, field in cls.LEVEL_FIELDS:
+                m2m_field = Tip._meta.get_field(field)
+                existing = _linked_ids(tip, m2m_field)
+                wanted = {item.pk for item in getattr(location_data, field)}
+                _update_links(tip, m2m_field, existing - wanted,
+                              wanted - existing)
+                linked.update((level, location_id)
+                              for location_id in existing)
+            indexed, current = cls.sync(tip, location_data)
+        return linked | indexed, current
+
+    @classmethod
+    def add_links(cls, level, tip_ids, location_ids):
+        """Index the links between tips and locations of a level.
+
+        Links are every pair of tip_ids and location_ids, one of which holds
+        a single id. Links already indexed are skipped.
+        """
+        existing = set(cls.objects.filter(
+            level=level, tip_id__in=tip_ids,
+            location_id__in=location_ids).values_list('tip_id', 'location_id'))
+        cls.objects.bulk_create(
+            cls(tip_id=tip_id, level=level, location_id=location_id)
+            for tip_id in tip_ids for location_id in location_ids
+            if (tip_id, location_id) not in existing)
+
+    @classmethod
+    def remove_links(cls, level, tip_ids, location_ids):
+        """Remove the links between tips and locations of a level.
+        """
+        cls.objects.filter(level=level, tip_id__in=tip_ids,
+                           location_id__in=location_ids).delete()
+
+    @classmethod
+    def remove_location(cls, level, location_id):
+        """Remove the links to a deleted location.
+
+        Returns the ids of the tips which were linked to it.
+        """
+        rows = cls.objects.filter(level=level, location_id=location_id)
+        tip_ids = set(rows.values_list('tip_id', flat=True))
+        rows.delete()
+        return tip_ids
+
+    @classmethod
+    def prune(cls):
+        """Remove the links to locations which do not exist anymore.
+
+        Returns the number of links removed.
+        """
+        removed = 0
+        for level, field in cls.LEVEL_FIELDS:
+            model = Tip._meta.get_field(field).related_model
+            removed += cls.objects.filter(level=level).exclude(
+                location_id__in=model.objects.values('pk')).delete()[0]
+        return removed
+
+
+def _linked_ids(tip, m2m_field):
+    """Ids of the locations linked to a tip by a many to many field.
+    """
+    through = m2m_field.remote_field.through
+    return set(through.objects.filter(**{
+        m2m_field.m2m_field_name(): tip,
+    }).values_list(m2m_field.m2m_reverse_field_name() + '_id', flat=True))
+
+
+def _update_links(tip, m2m_field, removed, added):
+    """Delete and insert rows of a tip many to many field through table.
+
+    The m2m_changed signals are sent as the related manager would, with
+    index_synced set as the index is already up to date.
+    """
+    through = m2m_field.remote_field.through
+    source = m2m_field.m2m_field_name()
+    target = m2m_field.m2m_reverse_field_name()
+    signal_kwargs = {
+        'sender': through,
+        'instance': tip,
+        'reverse': False,
+        'model': m2m_field.related_model,
+        'using': tip._state.db,
+        'index_synced': True,
+    }
+
+    if removed:
+        m2m_changed.send(action='pre_remove', pk_set=removed, **signal_kwargs)
+        through.objects.filter(**{
+            source: tip,
+            target + '__in': removed,
+        }).delete()
+        m2m_changed.send(action='post_remove', pk_set=removed,
+                         **signal_kwargs)
+
+    if added:
+        m2m_changed.send(action='pre_add', pk_set=added, **signal_kwargs)
+        through.objects.bulk_create(
+            through(**{source + '_id': tip.pk, target + '_id': location_id})
+            for location_id in added)
+        m2m_changed.send(action='post_add', pk_set=added, **signal_kwargs)
+
+
+class Vote(models.Model):
+    """A user vote on a tip.
+
+    Votes are only inserted. Their values are added to the tip scores later,
+    by batches, see localgreentips.tips.votes.
+    """
+    UP = 1
+    DOWN = -1
+    VALUE_CHOICES = (
+        (UP, 'up'),
+        (DOWN, 'down'),
+    )
+
+    tip = models.ForeignKey(
+        Tip,
+        related_name='votes',
+        on_delete=models.CASCADE,
+    )
+    user = models.ForeignKey(
+        'auth.User',
+        related_name='votes',
+        on_delete=models.CASCADE,
+    )
+    value = models.SmallIntegerField(choices=VALUE_CHOICES)
+    created = models.DateTimeField(auto_now_add=True)
+    applied = models.BooleanField(default=False, db_index=True)
+
+    class Meta:
+        unique_together = ('tip', 'user')
+
+    def __str__(self):
+        return "{} on {} by {}".format(
+            self.get_value_display(), self.tip_id, self.user_id)
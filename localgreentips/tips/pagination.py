@@ -0,0 +1,165 @@
+import bisect
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .locations import ResolvedLocation
+
+CURSOR_SALT = 'tips.cursor'
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_position(position):
+    """Whether a cursor position is a (rank, tip id) pair.
+    """
+    return (len(position) == 2 and _is_id(position[1]) and
+            isinstance(position[0], (int, float)) and
+            not isinstance(position[0], bool))
+
+
+def _is_location(location):
+    return (_is_id(location.closest_city_id) and
+            all(_is_id(city_id) for city_id in location.close_city_ids) and
+            all(location_id is None or _is_id(location_id)
+                for location_id in location[2:]))
+
+
+class TipCursorPagination(BasePagination):
+    """Keyset pagination over ranked tips.
+
+    The queryset must be ordered by a descending ranking field then by id.
+    Precomputed rankings, lists of (-rank, id) sorted ascending, can also be
+    paginated with paginate_ranking. The opaque cursor holds the ranking key
+    of the last tip of the page and the location resolved for the first page,
+    so that following pages neither resolve the location again nor scan the
+    tips before them. It is signed, so that clients can only send back the
+    locations they were given.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def decode_cursor(self, request):
+        """Return the position and location held by the request cursor.
+
+        Returns None when there is no cursor.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = signing.loads(encoded, salt=CURSOR_SALT)
+            position = tuple(data['p'])
+            location = data['l']
+            if location is not None:
+                location = ResolvedLocation(
+                    location[0], tuple(location[1]), *location[2:])
+        except (signing.BadSignature, TypeError, ValueError, KeyError,
+                IndexError):
+            raise NotFound(self.invalid_cursor_message)
+        if not (_is_position(position) and
+                (location is None or _is_location(location))):
+            raise NotFound(self.invalid_cursor_message)
+        return position, location
+
+    def encode_cursor(self, position, location):
+        return signing.dumps({'p': position, 'l': location},
+                             salt=CURSOR_SALT)
+
+    def get_cursor_location(self, request):
+        """Return whether the request has a cursor, and its location.
+        """
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            return False, None
+        return True, cursor[1]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.location = getattr(view, 'resolved_location', None)
+        self.ranking_field = queryset.query.order_by[0].lstrip('-')
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            value, last_id = cursor[0]
+            queryset = queryset.filter(
+                Q(**{self.ranking_field + '__lt': value}) |
+                Q(**{self.ranking_field: value, 'id__gt': last_id}))
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if self.page:
+            last = self.page[-1]
+            self.last_position = (getattr(last, self.ranking_field), last.id)
+        return self.page
+
+    def get_ranking_start(self, ranking, request):
+        """Index in a precomputed ranking of the first tip of the page.
+        """
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            return 0
+        value, last_id = cursor[0]
+        return bisect.bisect_right(ranking, (-value, last_id))
+
+    def has_ranking_page(self, ranking, request):
+        """Whether the page, and the tip after it, are in the ranking.
+        """
+        return (self.get_ranking_start(ranking, request) + self.page_size <
+                len(ranking))
+
+    def paginate_ranking(self, ranking, queryset, request, view=None,
+                         rank_field=None):
+        """Paginate a precomputed ranking, fetching the tips from queryset.
+
+        The rank of each tip is set as its rank_field attribute, if given.
+        """
+        self.request = request
+        self.location = getattr(view, 'resolved_location', None)
+
+        start = self.get_ranking_start(ranking, request)
+        entries = ranking[start:start + self.page_size + 1]
+        self.has_next = len(entries) > self.page_size
+        entries = entries[:self.page_size]
+        if entries:
+            self.last_position = (-entries[-1][0], entries[-1][1])
+
+        tips = queryset.in_bulk([pk for rank, pk in entries])
+        self.page = []
+        for rank, pk in entries:
+            if pk in tips:
+                if rank_field is not None:
+                    setattr(tips[pk], rank_field, -rank)
+                self.page.append(tips[pk])
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self.last_position
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param,
+                                   self.encode_cursor(position, self.location))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+
+class TipAreaPagination(TipCursorPagination):
+    """Larger pages for the tips of a map area.
+    """
+    page_size = settings.TIP_AREA_PAGE_SIZE
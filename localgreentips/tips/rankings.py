@@ -0,0 +1,162 @@
+"""Ranking of tips around a location, and precomputed rankings.
+
+Tips are boosted by the TIP_BOOST_WEIGHTS of the levels at which they match
+a resolved location, and by their relevance to a text search.
+
+A precomputed ranking is a list of (-rank, tip id) sorted ascending, which
+is the order of the tip feeds: highest rank first, then lowest id. Each
+resolved location which is requested, and the feed of tips without location,
+gets the ranking of its top tips. It is stored with the versions of the
+locations it depends on and rebuilt once one of them is bumped by a tip
+write, so that writers never update a shared ranking in place. A single
+request rebuilds it, holding a lock in the cache, while the others are served
+the previous ranking.
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.cache import cache
+from django.db.models import (
+    Case, Exists, ExpressionWrapper, F, FloatField, IntegerField, Max,
+    OuterRef, Q, Subquery, Value, When)
+from django.db.models.functions import Cast, Coalesce
+
+from . import caching
+from .models import Tip, TipLocation
+
+logger = logging.getLogger(__name__)
+
+RANKING_KEY_PREFIX = 'tips:ranking:'
+RANKING_LOCK_SUFFIX = ':lock'
+
+
+def global_tips():
+    """Tips which are not attached to any location, from the index.
+    """
+    return Tip.objects.annotate(
+        has_location=Exists(
+            TipLocation.objects.filter(tip=OuterRef('pk')))).filter(
+                has_location=False)
+
+
+def get_boosts(resolved):
+    """Return the (level, location ids, weight) matching a location.
+    """
+    weights = settings.TIP_BOOST_WEIGHTS
+    boosts = (
+        (TipLocation.CITY, [resolved.closest_city_id],
+         weights['closest_city']),
+        (TipLocation.CITY, list(resolved.close_city_ids),
+         weights['close_cities']),
+        (TipLocation.SUBREGION, [resolved.subregion_id],
+         weights['subregion']),
+        (TipLocation.REGION, [resolved.region_id], weights['region']),
+        (TipLocation.COUNTRY, [resolved.country_id], weights['country']),
+    )
+    return [boost for boost in boosts if any(boost[1])]
+
+
+def rank_tips(resolved, search=None):
+    """Tips local to a resolved location or global, ordered by boost score.
+
+    The links of each tip matching the location are aggregated in a single
+    grouped subquery on the TipLocation index, giving every matched level
+    its weight once. Tips get their score plus (score + 1) times the sum of
+    the weights, so there are no duplicate rows to remove.
+
+    With a search, only the tips matching it are kept and their boost score
+    becomes their text search rank times one plus their local score, so
+    that relevance and locality rank together.
+    """
+    if resolved is None:
+        queryset = global_tips()
+        local_score = F('score')
+    else:
+        boosts = get_boosts(resolved)
+        matching = Q()
+        weight = Value(0, output_field=IntegerField())
+        for level, location_ids, level_weight in boosts:
+            match = Q(level=level, location_id__in=location_ids)
+            matching |= match
+            weight = weight + Max(Case(
+                When(match, then=Value(level_weight)),
+                default=Value(0),
+                output_field=IntegerField()))
+
+        matching_links = TipLocation.objects.filter(matching)
+        tip_weight = matching_links.filter(
+            tip=OuterRef('pk')).order_by().values('tip').annotate(
+                weight=weight).values('weight')
+
+        queryset = Tip.objects.annotate(
+            has_location=Exists(
+                TipLocation.objects.filter(tip=OuterRef('pk'))),
+            location_weight=Coalesce(
+                Subquery(tip_weight, output_field=IntegerField()),
+                Value(0, output_field=IntegerField())),
+        ).filter(
+            Q(pk__in=matching_links.values('tip')) | Q(has_location=False))
+        local_score = F('score') + (F('score') + 1) * F('location_weight')
+
+    # The search vector is only used by the database.
+    queryset = queryset.defer('search_vector')
+    if search:
+        query = SearchQuery(search, config=Tip.SEARCH_CONFIG)
+        queryset = queryset.filter(search_vector=query).annotate(
+            search_rank=Cast(SearchRank(F('search_vector'), query),
+                             FloatField()))
+        boost_score = ExpressionWrapper(
+            F('search_rank') * (local_score + 1), output_field=FloatField())
+    elif resolved is not None:
+        boost_score = ExpressionWrapper(
+            local_score, output_field=IntegerField())
+    else:
+        return queryset.order_by('-score', 'id')
+
+    return queryset.annotate(boost_score=boost_score).order_by(
+        '-boost_score', 'id')
+
+
+def get_ranking_key(resolved):
+    return RANKING_KEY_PREFIX + hashlib.md5(
+        repr(resolved).encode()).hexdigest()
+
+
+def get_ranking(resolved):
+    """Ranking of the top tips of a resolved location, or of global tips.
+
+    Returns the ranking of at most TIP_RANKING_SIZE tips, whether it holds
+    all the tips of the feed, and whether it is current. While another
+    request rebuilds it, the previous ranking is returned as not current, or
+    None when there is none.
+    """
+    size = settings.TIP_RANKING_SIZE
+    key = get_ranking_key(resolved)
+    versions = caching.get_versions(caching.location_dependencies(resolved))
+    entry = cache.get(key)
+    if entry is not None and entry[0] == versions:
+        ranking = entry[1]
+    else:
+        lock_key = key + RANKING_LOCK_SUFFIX
+        if not cache.add(lock_key, True, settings.TIP_RANKING_LOCK_SECONDS):
+            if entry is None:
+                return None, False, False
+            ranking = entry[1]
+            return ranking[:size], len(ranking) <= size, False
+        try:
+            rank_field = 'score' if resolved is None else 'boost_score'
+            fresh = caching.is_fresh(versions)
+            # One more tip tells whether the ranking is complete.
+            ranking = [(-rank, pk) for rank, pk in
+                       rank_tips(resolved).values_list(
+                           rank_field, 'pk')[:size + 1]]
+            logger.debug("Rebuilt tips ranking of %s", resolved)
+            # A ranking read from a lagging replica is not stored as current.
+            if fresh:
+                cache.set(key, (versions, ranking),
+                          settings.TIP_RANKING_CACHE_TTL)
+        finally:
+            cache.delete(lock_key)
+    return ranking[:size], len(ranking) <= size, True
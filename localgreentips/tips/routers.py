@@ -0,0 +1,150 @@
+"""Routing of read-only requests to database replicas.
+
+ReplicaMiddleware picks one of the REPLICA_DATABASES at random for each GET,
+HEAD and OPTIONS request, and ReplicaRouter sends all the reads of the
+request to it, so that they see the same state of the database. Every
+write, the reads of other requests and the reads made inside a transaction
+go to the default database, as do authentication reads so that a token is
+usable as soon as it is created.
+
+Replicas lag behind the default database, so a client which just wrote
+something, identified by its Authorization header, keeps reading from the
+default database for REPLICA_STICKY_SECONDS. For the same reason, data read
+from a replica is only cached under version counters when the replica has
+replayed the writes counted by them: counters carry the WAL position of the
+default database when they were bumped, see reads_include.
+"""
+import contextlib
+import hashlib
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_KEY_PREFIX = 'tips:replica:sticky:'
+# Applications whose reads are never sent to replicas
+PRIMARY_APPS = ('auth', 'authtoken', 'sessions')
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_local = threading.local()
+
+
+def get_replica():
+    """Replica the reads of the current request go to, or None.
+    """
+    return getattr(_local, 'replica', None)
+
+
+@contextlib.contextmanager
+def use_default():
+    """Send the reads of the block to the default database.
+    """
+    previous = get_replica()
+    _local.replica = None
+    try:
+        yield
+    finally:
+        _local.replica = previous
+
+
+def parse_lsn(lsn):
+    """Integer position of a PostgreSQL WAL location like '16/B374D848'.
+    """
+    high, low = lsn.split('/')
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+def _query_lsn(alias, function):
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT {}()'.format(function))
+        lsn = cursor.fetchone()[0]
+    return None if lsn is None else parse_lsn(lsn)
+
+
+def primary_position():
+    """Current WAL position of the default database.
+
+    Returns None without replicas, as there is nothing to wait for.
+    """
+    if not settings.REPLICA_DATABASES:
+        return None
+    return _query_lsn(DEFAULT_DB_ALIAS, 'pg_current_wal_lsn')
+
+
+def replica_position():
+    """WAL position replayed by the replica of the current request.
+
+    It is read once per request, the first time it is needed, which must be
+    before the reads it vouches for. A replica which is not in recovery,
+    like the default database used as replica, has replayed everything.
+    """
+    if not hasattr(_local, 'replica_position'):
+        position = _query_lsn(get_replica(), 'pg_last_wal_replay_lsn')
+        _local.replica_position = position
+    return _local.replica_position
+
+
+def reads_include(position):
+    """Whether the reads of the request see the writes up to position.
+    """
+    if get_replica() is None or not position:
+        return True
+    replayed = replica_position()
+    return replayed is None or replayed >= position
+
+
+def get_sticky_key(request):
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return STICKY_KEY_PREFIX + hashlib.md5(
+        authorization.encode()).hexdigest()
+
+
+class ReplicaRouter:
+    """Send reads to the replica of the current request, if any.
+    """
+    def db_for_read(self, model, **hints):
+        replica = get_replica()
+        if (replica is None or model._meta.app_label in PRIMARY_APPS or
+                connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = (DEFAULT_DB_ALIAS,) + tuple(settings.REPLICA_DATABASES)
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """Pick the replica of safe requests of clients which did not write.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sticky_key = get_sticky_key(request)
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            if sticky_key is not None:
+                cache.set(sticky_key, True, settings.REPLICA_STICKY_SECONDS)
+            return response
+
+        if settings.REPLICA_DATABASES and not (
+                sticky_key is not None and cache.get(sticky_key)):
+            _local.replica = random.choice(settings.REPLICA_DATABASES)
+        try:
+            return self.get_response(request)
+        finally:
+            _local.replica = None
+            _local.__dict__.pop('replica_position', None)
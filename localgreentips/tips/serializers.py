@@ -1,4 +1,5 @@
 import logging
+from collections import OrderedDict
 
 from django.contrib.auth.models import User
 from django.contrib.auth.validators import UnicodeUsernameValidator
@@ -7,7 +8,8 @@ from rest_framework.exceptions import ValidationError
 
 from cities.models import Country, Region, Subregion, City
 
-from .models import Tip, Comment
+from . import caching, timing
+from .models import Tip, TipLocation, Vote, Comment
 
 logger = logging.getLogger(__name__)
 
@@ -71,6 +73,33 @@ class CityNestedSerializer(serializers.ModelSerializer):
         model = City
         fields = ('id', 'name', 'subregion', 'region', 'country')
 
+# Columns read by serialize_cities
+CITY_VALUES = ('id', 'name', 'subregion_id', 'subregion__name',
+               'region_id', 'region__name', 'country_id', 'country__name')
+
+def _named(location_id, name):
+    if location_id is None:
+        return None
+    return OrderedDict((('id', location_id), ('name', name)))
+
+def serialize_cities(rows):
+    """Build the CityNestedSerializer representation of CITY_VALUES tuples.
+
+    Used on list pages, where instantiating models and serializer fields
+    for each city is the main cost.
+    """
+    return [
+        OrderedDict((
+            ('id', city_id),
+            ('name', name),
+            ('subregion', _named(subregion_id, subregion_name)),
+            ('region', _named(region_id, region_name)),
+            ('country', _named(country_id, country_name)),
+        ))
+        for (city_id, name, subregion_id, subregion_name,
+             region_id, region_name, country_id, country_name) in rows
+    ]
+
 
 class UserSerializer(serializers.ModelSerializer):
 
@@ -92,6 +121,123 @@ class LocationData:
         self.regions = regions
         self.countries = countries
 
+LOCATION_MODELS = (
+    ('cities', City),
+    ('subregions', Subregion),
+    ('regions', Region),
+    ('countries', Country),
+)
+
+def load_locations(tips_data):
+    """Fetch the locations referenced by tips data, one query per model.
+
+    Returns for each location field a dict of the locations by id.
+    """
+    locations = {}
+    for name, model in LOCATION_MODELS:
+        ids = {item["id"] for data in tips_data for item in data.get(name, [])}
+        locations[name] = \
+            model.objects.only('id', 'name').in_bulk(ids) if ids else {}
+    return locations
+
+def pop_location_data(validated_data, locations):
+    """Pop the location fields of validated data and check them.
+
+    Locations are looked up in the result of load_locations, all the unknown
+    ids and mismatching names are reported in one ValidationError.
+    """
+    related = {}
+    errors = {}
+    for name, model in LOCATION_MODELS:
+        related[name] = []
+        for item in validated_data.pop(name, []):
+            related_item = locations[name].get(item["id"])
+            if related_item is None:
+                errors.setdefault(name, []).append(
+                    "{} {} doesn't exist".format(
+                        model._meta.verbose_name, item["id"]))
+            elif related_item.name != item["name"]:
+                errors.setdefault(name, []).append(
+                    "id and name don't match for {}".format(item["name"]))
+            else:
+                related[name].append(related_item)
+    if errors:
+        raise ValidationError(errors)
+    return LocationData(**related)
+
+def _related_ordering(model, prefix):
+    """Ordering of a related model default ordering, seen from prefix.
+    """
+    ordering = []
+    for field in model._meta.ordering:
+        if isinstance(field, str):
+            descending = field.startswith('-')
+            ordering.append('{}{}__{}'.format(
+                '-' if descending else '', prefix, field.lstrip('-')))
+    return ordering
+
+class TipListSerializer(serializers.ListSerializer):
+    """Fast representation of a list of tips.
+
+    Instead of running the nested serializers for each tip, the locations
+    and tippers of all the tips are read as values, with one query per
+    relation, and each tip is built in a single pass.
+    """
+
+    def _load_locations(self, tip_ids):
+        locations = {}
+        for name, model in LOCATION_MODELS:
+            m2m_field = Tip._meta.get_field(name)
+            through = m2m_field.remote_field.through
+            source = m2m_field.m2m_field_name()
+            target = m2m_field.m2m_reverse_field_name()
+            rows = through.objects.filter(**{
+                source + '__in': tip_ids,
+            }).order_by(*_related_ordering(model, target) + ['pk'])
+            by_tip = {}
+            for tip_id, location_id, location_name in rows.values_list(
+                    source + '_id', target + '_id', target + '__name'):
+                by_tip.setdefault(tip_id, []).append(OrderedDict((
+                    ('id', location_id), ('name', location_name))))
+            locations[name] = by_tip
+        return locations
+
+    def _load_tippers(self, tips):
+        usernames = {tip.tipper.pk: tip.tipper.username for tip in tips
+                     if tip.tipper_id and Tip.tipper.is_cached(tip)}
+        missing = {tip.tipper_id for tip in tips
+                   if tip.tipper_id and tip.tipper_id not in usernames}
+        if missing:
+            usernames.update(User.objects.filter(pk__in=missing).values_list(
+                'pk', 'username'))
+        return usernames
+
+    def to_representation(self, data):
+        tips = list(data.all() if hasattr(data, 'all') else data)
+        with timing.phase('prefetch'):
+            locations = self._load_locations([tip.pk for tip in tips])
+            usernames = self._load_tippers(tips)
+
+        representation = []
+        for tip in tips:
+            item = OrderedDict((
+                ('id', tip.pk),
+                ('title', tip.title),
+                ('tipper', OrderedDict((
+                    ('username', usernames[tip.tipper_id]),
+                )) if tip.tipper_id in usernames else None),
+                ('text', tip.text),
+                ('score', float(tip.score)),
+            ))
+            boost_score = getattr(tip, 'boost_score', None)
+            if boost_score is not None:
+                item['boost_score'] = float(boost_score)
+            for name in ('cities', 'regions', 'subregions', 'countries'):
+                item[name] = locations[name].get(tip.pk, [])
+            representation.append(item)
+        return representation
+
+
 class TipSerializer(serializers.ModelSerializer):
 
     cities = CitySerializer(many=True, required=False)
@@ -107,48 +253,24 @@ class TipSerializer(serializers.ModelSerializer):
         fields = ('id', 'title', 'tipper', 'text',
                   'score', 'boost_score', 'cities',
                   'regions', 'subregions', 'countries')
-
+        list_serializer_class = TipListSerializer
 
 
     def _update_tip_data(self, validated_data):
         """From validated data, update a tip object with location information.
         """
-        def get_related(model, name):
-            try:
-                data = validated_data.pop(name)
-            except KeyError:
-                data = []
-            related = []
-
-            for item in data:
-                related_item = model.objects.get(pk=item["id"])
-                if related_item.name != item["name"]:
-                    raise ValidationError(
-                        "id and name don't match for {}".format(item["name"]))
-                related.append(related_item)
-            return related
-
-        cities = get_related(City, "cities")
-        subregions = get_related(Subregion, "subregions")
-        regions = get_related(Region, "regions")
-        countries = get_related(Country, "countries")
-
-        return LocationData(cities, subregions, regions, countries)
+        locations = load_locations([validated_data])
+        return pop_location_data(validated_data, locations)
 
     def _get_request_tipper(self):
-        tipper_username = None
         request = self.context.get("request")
-        if request and hasattr(request, "user"):
-            tipper_username = request.user
-        logger.debug("Retrieving tipper: %s", tipper_username)
-        tipper = User.objects.get(username=tipper_username)
+        tipper = getattr(request, "user", None)
+        logger.debug("Retrieving tipper: %s", tipper)
         return tipper
 
     def _update_tip_from_location_data(self, tip, location_data):
-        tip.cities.set(location_data.cities)
-        tip.subregions.set(location_data.subregions)
-        tip.regions.set(location_data.regions)
-        tip.countries.set(location_data.countries)
+        previous, current = TipLocation.update_tip(tip, location_data)
+        caching.bump_tip_locations(previous, current)
 
     def create(self, validated_data):
         logger.debug("Creating tip. Validated data: %s", validated_data)
@@ -169,7 +291,15 @@ class TipSerializer(serializers.ModelSerializer):
         location_data = self._update_tip_data(validated_data)
         tip.title = validated_data["title"]
         tip.text = validated_data["text"]
-        self._update_tip_from_location_data(tip, location_data)
         tip.save()
+        self._update_tip_from_location_data(tip, location_data)
 
         return tip
+
+
+class VoteSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Vote
+        fields = ('tip', 'value', 'created')
+        read_only_fields = ('tip', 'created')
@@ -0,0 +1,121 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete)
+from django.dispatch import receiver
+
+from cities.models import City, Country, Region, Subregion
+from rest_framework.authtoken.models import Token
+
+from . import authentication, caching, locations, spatial
+from .models import Tip, TipLocation
+
+# Level and many to many field of each location through table
+THROUGH_FIELDS = {
+    Tip._meta.get_field(field).remote_field.through:
+        (level, Tip._meta.get_field(field))
+    for level, field in TipLocation.LEVEL_FIELDS
+}
+LOCATION_LEVELS = {
+    Tip._meta.get_field(field).related_model: level
+    for level, field in TipLocation.LEVEL_FIELDS
+}
+
+
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def clear_location_cache(sender, **kwargs):
+    # The name index is too costly to rebuild on every city change, it is
+    # rebuilt by refresh_city_index.
+    locations.clear_cache()
+    spatial.invalidate()
+    caching.bump_cities()
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    authentication.invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+@receiver(pre_delete, sender=User)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    authentication.invalidate_tokens(
+        Token.objects.filter(user=instance).values_list('key', flat=True))
+
+
+@receiver(post_save, sender=Tip)
+@receiver(pre_delete, sender=Tip)
+def invalidate_tip(sender, instance, **kwargs):
+    caching.bump_tip(instance)
+
+
+def locations_changed(level, tip_ids, location_ids):
+    """Invalidate what depends on changed links of tips and locations.
+    """
+    located = set(TipLocation.objects.filter(tip_id__in=tip_ids).exclude(
+        level=level, location_id__in=location_ids).values_list(
+            'tip_id', flat=True))
+    # Tips without other locations were or became global.
+    caching.bump_locations(
+        {(level, location_id) for location_id in location_ids},
+        include_global=bool(set(tip_ids) - located))
+
+
+def linked_ids(m2m_field, instance, reverse):
+    """Ids on the other side of the links of a tip or a location.
+    """
+    through = m2m_field.remote_field.through
+    source = m2m_field.m2m_field_name()
+    target = m2m_field.m2m_reverse_field_name()
+    if reverse:
+        return set(through.objects.filter(**{target: instance}).values_list(
+            source + '_id', flat=True))
+    return set(through.objects.filter(**{source: instance}).values_list(
+        target + '_id', flat=True))
+
+
+@receiver(m2m_changed, sender=Tip.cities.through)
+@receiver(m2m_changed, sender=Tip.subregions.through)
+@receiver(m2m_changed, sender=Tip.regions.through)
+@receiver(m2m_changed, sender=Tip.countries.through)
+def update_tip_locations(sender, instance, action, reverse, pk_set,
+                         index_synced=False, **kwargs):
+    """Keep the location index in line with the many to many fields.
+    """
+    level, m2m_field = THROUGH_FIELDS[sender]
+    cleared_attribute = '_cleared_{}'.format(m2m_field.name)
+    if index_synced:
+        # TipLocation.update_tip indexes the links and bumps the caches.
+        return
+    if action == 'pre_clear':
+        # Cleared links can only be found before they are deleted.
+        setattr(instance, cleared_attribute,
+                linked_ids(m2m_field, instance, reverse))
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop(cleared_attribute, set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if not pk_set:
+        return
+
+    if reverse:
+        tip_ids, location_ids = pk_set, {instance.pk}
+    else:
+        tip_ids, location_ids = {instance.pk}, pk_set
+    if action == 'post_add':
+        TipLocation.add_links(level, tip_ids, location_ids)
+    else:
+        TipLocation.remove_links(level, tip_ids, location_ids)
+    locations_changed(level, tip_ids, location_ids)
+
+
+@receiver(post_delete, sender=City)
+@receiver(post_delete, sender=Subregion)
+@receiver(post_delete, sender=Region)
+@receiver(post_delete, sender=Country)
+def remove_deleted_location(sender, instance, **kwargs):
+    level = LOCATION_LEVELS[sender]
+    tip_ids = TipLocation.remove_location(level, instance.pk)
+    if tip_ids:
+        locations_changed(level, tip_ids, {instance.pk})
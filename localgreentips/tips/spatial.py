@@ -0,0 +1,123 @@
+"""In-memory spatial index over cities for nearest city searches.
+
+The index is optional: it needs numpy and scipy and is enabled with the
+CITY_INDEX_ENABLED setting. City coordinates are stored as unit vectors in
+a KD-tree, as the chord between two points of the sphere grows with their
+great-circle distance, which is then derived with the haversine formula.
+
+Each worker builds its own index the first time it is needed, see
+indexes.WorkerIndex. Run the refresh_city_index command after importing
+cities so that every worker rebuilds it.
+"""
+import math
+
+from django.conf import settings
+from django.db.models import F, FloatField, Func
+
+from cities.models import City
+
+from . import indexes
+from .indexes import EARTH_RADIUS_KM
+
+try:
+    import numpy
+    from scipy.spatial import cKDTree
+except ImportError:
+    numpy = None
+
+VERSION_KEY = 'tips:city_index_version'
+
+
+def _to_unit_vectors(longitudes, latitudes):
+    longitudes = numpy.radians(numpy.asarray(longitudes, dtype=numpy.float64))
+    latitudes = numpy.radians(numpy.asarray(latitudes, dtype=numpy.float64))
+    cos_latitudes = numpy.cos(latitudes)
+    return numpy.column_stack((cos_latitudes * numpy.cos(longitudes),
+                               cos_latitudes * numpy.sin(longitudes),
+                               numpy.sin(latitudes)))
+
+
+def _chord_from_km(distance_km):
+    angle = min(distance_km / EARTH_RADIUS_KM, math.pi)
+    return 2 * math.sin(angle / 2)
+
+
+def _km_from_chord(chords):
+    return 2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.minimum(chords / 2, 1))
+
+
+class CityIndex:
+    """KD-tree over the coordinates of all cities.
+    """
+    def __init__(self, ids, longitudes, latitudes):
+        self.ids = numpy.asarray(ids, dtype=numpy.int64)
+        self.tree = cKDTree(_to_unit_vectors(longitudes, latitudes))
+
+    @classmethod
+    def build(cls):
+        rows = City.objects.annotate(
+            longitude=Func(F('location'), function='ST_X',
+                           output_field=FloatField()),
+            latitude=Func(F('location'), function='ST_Y',
+                          output_field=FloatField()),
+        ).values_list('pk', 'longitude', 'latitude').order_by()
+        data = numpy.array(list(rows.iterator()), dtype=numpy.float64)
+        if not len(data):
+            data = numpy.empty((0, 3))
+        return cls(data[:, 0], data[:, 1], data[:, 2])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def nearest(self, longitude, latitude, radius_km, limit=None):
+        """Ids and distances in km of the cities within radius_km.
+
+        Returns at most limit cities, closest first.
+        """
+        if not len(self):
+            return []
+        point = _to_unit_vectors([longitude], [latitude])[0]
+        max_chord = _chord_from_km(radius_km)
+        if limit is None:
+            positions = numpy.asarray(
+                self.tree.query_ball_point(point, max_chord), dtype=int)
+            chords = numpy.linalg.norm(
+                self.tree.data[positions] - point, axis=1)
+            order = numpy.argsort(chords, kind='stable')
+            positions, chords = positions[order], chords[order]
+        else:
+            chords, positions = self.tree.query(
+                point, k=min(limit, len(self)),
+                distance_upper_bound=max_chord)
+            chords = numpy.atleast_1d(chords)
+            positions = numpy.atleast_1d(positions)
+            found = numpy.isfinite(chords)
+            positions, chords = positions[found], chords[found]
+        return list(zip(self.ids[positions].tolist(),
+                        _km_from_chord(chords).tolist()))
+
+
+_index = indexes.WorkerIndex('city index', VERSION_KEY, CityIndex.build)
+
+
+def is_enabled():
+    return numpy is not None and settings.CITY_INDEX_ENABLED
+
+
+def get_index():
+    """Return the city index of this worker, or None if it is disabled.
+
+    The index is rebuilt when it was invalidated locally or when the shared
+    version was bumped by refresh_index.
+    """
+    if not is_enabled():
+        return None
+    return _index.get()
+
+
+def invalidate():
+    _index.invalidate()
+
+
+def refresh_index():
+    _index.refresh()
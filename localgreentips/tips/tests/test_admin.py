@@ -0,0 +1,38 @@
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.test import TestCase
+
+from cities.models import Country, Region, City
+
+from localgreentips.tips.models import Tip, Vote
+
+
+class TipAdminTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            "admin", "admin@test.com", "pouetpouet")
+        self.client.force_login(self.admin)
+        country = Country.objects.create(name="Syldavie", population=642000)
+        region = Region.objects.create(name="Klow", country=country)
+        self.city = City.objects.create(
+            name="Niedzdrow", region=region, country=country,
+            location=Point(20, 45), population=1200)
+
+    def test_changelist_counts(self):
+        tip = Tip.objects.create(title="counted", text="admin", score=0,
+                                 tipper=self.admin)
+        tip.cities.add(self.city)
+        Vote.objects.create(tip=tip, user=self.admin, value=Vote.UP)
+
+        response = self.client.get("/admin/tips/tip/", {"q": "count"})
+        self.assertEqual(response.status_code, 200)
+        tip = response.context["cl"].result_list[0]
+        self.assertEqual((tip.location_count, tip.vote_count), (1, 1))
+
+    def test_city_autocomplete(self):
+        response = self.client.get("/admin/cities/city/autocomplete/",
+                                   {"term": "niedz"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result["id"] for result in response.json()[
+            "results"]], [str(self.city.pk)])
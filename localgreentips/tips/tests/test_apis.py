@@ -1,21 +1,37 @@
+import base64
 import logging
+import tempfile
 import urllib.parse
 
+from django.contrib.auth.models import User
 from django.contrib.gis.geos import Point
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.test import override_settings
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APITransactionTestCase
 
 
 
 from cities.models import Country, Region, City
 
+from localgreentips.tips import (
+    authentication, caching, locations, rankings, typeahead, votes)
+from localgreentips.tips.models import Tip, TipLocation
+from localgreentips.tips.pagination import CURSOR_SALT
+
 logger = logging.getLogger(__name__)
 
 register_url = "/auth/users/"
 login_url = "/auth/token/login/"
 logout_url = "/auth/token/logout/"
 tips_url = "/tips/"
+tips_batch_url = "/tips/batch/"
+tips_area_url = "/tips/area/"
+clusters_url = "/clusters/{}/{}/{}/"
 cities_url = "/cities/"
+FILE_CACHE_BACKEND = "django.core.cache.backends.filebased.FileBasedCache"
 
 def get_tip_put_url(tip_id):
     return urllib.parse.urljoin(tips_url, str(tip_id), "/") + "/"
@@ -53,7 +69,19 @@ class TestUser:
         client.credentials()
         return response
 
-class AuthTests(APITestCase):
+class TipsAPITestCase(APITransactionTestCase):
+    """Test case starting with empty caches.
+
+    Writes are committed, so that they bump the cache versions.
+    """
+
+    def setUp(self):
+        cache.clear()
+        locations.clear_cache()
+        typeahead.invalidate()
+
+
+class AuthTests(TipsAPITestCase):
 
     def test_register_and_login(self):
         user = TestUser("titi",
@@ -74,8 +102,43 @@ class AuthTests(APITestCase):
         response = user.logout(self.client)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
+    def test_logout_invalidates_cached_token(self):
+        # Tokens are only cached by a cache shared between processes.
+        with tempfile.TemporaryDirectory() as location, self.settings(
+                CACHES={"default": {"BACKEND": FILE_CACHE_BACKEND,
+                                    "LOCATION": location}}):
+            user = TestUser("tata",
+                            "tata@test.fr",
+                            "pouetpouet")
+            user.register(self.client)
+            token = user.login(self.client).data["auth_token"]
+            response = self.client.get(tips_url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            # The token user comes from the cache.
+            with self.assertNumQueries(0):
+                response = self.client.get("/auth/users/me/")
+            self.assertEqual(response.data["username"], "tata")
+
+            user.logout(self.client)
+            self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+            response = self.client.get(tips_url)
+            self.assertEqual(response.status_code,
+                             status.HTTP_401_UNAUTHORIZED)
+
+    def test_tokens_not_cached_in_process_local_cache(self):
+        user = TestUser("tutu",
+                        "tutu@test.fr",
+                        "pouetpouet")
+        user.register(self.client)
+        token = user.login(self.client).data["auth_token"]
+        response = self.client.get("/auth/users/me/")
+        self.assertEqual(response.data["username"], "tutu")
+        self.assertIsNone(
+            cache.get(authentication.get_token_cache_key(token)))
 
-class TipTests(APITestCase):
+
+class TipTests(TipsAPITestCase):
 
     def test_get_default_empty(self):
         response = self.client.get(tips_url)
@@ -90,9 +153,129 @@ class TipTests(APITestCase):
         response = self.client.post(tips_url, data)
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_cursor_pagination(self):
+        user = User.objects.create(username="paginator")
+        for i in range(15):
+            Tip.objects.create(title="tip {}".format(i), text="paginated",
+                               score=i % 3, tipper=user)
+
+        seen = []
+        response = self.client.get(tips_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 10)
+        seen += [tip["id"] for tip in response.data["results"]]
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 5)
+        self.assertIsNone(response.data["next"])
+        seen += [tip["id"] for tip in response.data["results"]]
+
+        expected = Tip.objects.order_by("-score", "id").values_list(
+            "id", flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_global_tips_ranking_follows_changes(self):
+        user = User.objects.create(username="ranker")
+        first = Tip.objects.create(title="first", text="global", score=1,
+                                   tipper=user)
+        second = Tip.objects.create(title="second", text="global", score=2,
+                                    tipper=user)
+
+        response = self.client.get(tips_url)
+        self.assertEqual([tip["id"] for tip in response.data["results"]],
+                         [second.id, first.id])
+
+        first.score = 3
+        first.save()
+        country = Country.objects.create(name="Borduria", population=10)
+        second.countries.add(country)
+        response = self.client.get(tips_url)
+        self.assertEqual([tip["id"] for tip in response.data["results"]],
+                         [first.id])
+
+    def test_ranking_rebuilt_by_one_request(self):
+        user = User.objects.create(username="ranker")
+        first = Tip.objects.create(title="first", text="global", score=1,
+                                   tipper=user)
+        self.client.get(tips_url)
+        second = Tip.objects.create(title="second", text="global", score=2,
+                                    tipper=user)
+
+        # Another request is rebuilding the ranking, the previous one is used.
+        lock_key = (rankings.get_ranking_key(None) +
+                    rankings.RANKING_LOCK_SUFFIX)
+        cache.set(lock_key, True)
+        response = self.client.get(tips_url)
+        self.assertEqual([tip["id"] for tip in response.data["results"]],
+                         [first.id])
+        self.assertNotIn("ETag", response)
+
+        cache.delete(lock_key)
+        response = self.client.get(tips_url)
+        self.assertEqual([tip["id"] for tip in response.data["results"]],
+                         [second.id, first.id])
+        self.assertIn("ETag", response)
+
+        # Without previous ranking, the feed is ranked by the database.
+        cache.clear()
+        cache.set(lock_key, True)
+        response = self.client.get(tips_url)
+        self.assertEqual([tip["id"] for tip in response.data["results"]],
+                         [second.id, first.id])
+
+    def test_search_vector_not_loaded(self):
+        self.assertNotIn("search_vector", str(rankings.rank_tips(None).query))
+
+    def test_versions_bumped_on_commit(self):
+        user = User.objects.create(username="writer")
+        keys = [caching.GLOBAL_VERSION_KEY]
+        versions = caching.get_versions(keys)
+        with transaction.atomic():
+            Tip.objects.create(title="pending", text="global", tipper=user)
+            # Readers can't cache uncommitted tips under a new version.
+            self.assertEqual(caching.get_versions(keys), versions)
+        self.assertNotEqual(caching.get_versions(keys), versions)
+
+    @override_settings(TIP_RANKING_SIZE=11)
+    def test_global_tips_past_precomputed_ranking(self):
+        user = User.objects.create(username="ranker")
+        for score in range(12):
+            Tip.objects.create(title="tip {}".format(score), text="global",
+                               score=score, tipper=user)
 
-class TipAuthenticatedTests(APITestCase):
+        response = self.client.get(tips_url)
+        results = response.data["results"]
+        response = self.client.get(response.data["next"])
+        self.assertIsNone(response.data["next"])
+        results += response.data["results"]
+        self.assertEqual([tip["title"] for tip in results],
+                         ["tip {}".format(score)
+                          for score in reversed(range(12))])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(tips_url, {"cursor": "garbage"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # Cursors are signed, and their content is checked even so.
+        forged = base64.urlsafe_b64encode(
+            b'{"p":[1,1],"l":[1,[],null,null,null]}').decode()
+        cursors = [forged] + [
+            signing.dumps(data, salt=CURSOR_SALT) for data in (
+                {"p": ["x", 1], "l": None},
+                {"p": [1, True], "l": None},
+                {"p": [1, 1], "l": [None, [], None, None, None]},
+                {"p": [1, 1], "l": [1, ["x"], None, None, None]},
+            )]
+        for cursor in cursors:
+            response = self.client.get(tips_url, {"cursor": cursor})
+            self.assertEqual(response.status_code,
+                             status.HTTP_404_NOT_FOUND, cursor)
+
+
+class TipAuthenticatedTests(TipsAPITestCase):
     def setUp(self):
+        super().setUp()
         country = Country(name="Empire anarchique du Bachibouzouc",
                           population=12000)
         country.save()
@@ -119,8 +302,8 @@ class TipAuthenticatedTests(APITestCase):
             "password": "pouetpouet",
         }
         response = self.client.post(login_url, data, format="json")
-        token = response.data["auth_token"]
-        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.token = response.data["auth_token"]
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
 
     def test_get_default_empty(self):
         response = self.client.get(tips_url)
@@ -287,12 +470,404 @@ class TipAuthenticatedTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["text"], updated_text)
 
+    def test_local_tip_lookup_without_position(self):
+        # Tips attached to a location are found by id without coordinates.
+        city = City.objects.get(name="Montcuq")
+        tip_data = {
+            "title": "test lookup",
+            "text": "local tip",
+            "cities": [{"id": city.id, "name": city.name}],
+        }
+        response = self.client.post(tips_url, tip_data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        tip_url = get_tip_put_url(response.data["id"])
+
+        response = self.client.get(tip_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        tip_data["text"] = "updated local tip"
+        response = self.client.put(tip_url, tip_data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["text"], "updated local tip")
+
+    def test_update_tip_location_index(self):
+        city = City.objects.get(name="Montcuq")
+        tip_data = {
+            "title": "test index",
+            "text": "testing location index",
+            "cities": [{"id": city.id, "name": city.name}],
+            "countries": [{"id": city.country.id,
+                           "name": city.country.name}],
+        }
+        response = self.client.post(tips_url, tip_data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        tip_id = response.data["id"]
+        self.assertEqual(
+            set(TipLocation.objects.filter(tip=tip_id).values_list(
+                "level", "location_id")),
+            {(TipLocation.CITY, city.id),
+             (TipLocation.COUNTRY, city.country.id)})
+
+        tip_data["countries"] = []
+        response = self.client.put(get_tip_put_url(tip_id), tip_data,
+                                   format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            list(TipLocation.objects.filter(tip=tip_id).values_list(
+                "level", "location_id")),
+            [(TipLocation.CITY, city.id)])
+
+        # Links missing from the index are re-indexed, not inserted again.
+        TipLocation.objects.filter(tip=tip_id).delete()
+        response = self.client.put(get_tip_put_url(tip_id), tip_data,
+                                   format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            list(TipLocation.objects.filter(tip=tip_id).values_list(
+                "level", "location_id")),
+            [(TipLocation.CITY, city.id)])
+        self.assertEqual(list(Tip.objects.get(pk=tip_id).cities.all()),
+                         [city])
+
+    def test_create_tip_reports_all_location_errors(self):
+        city = City.objects.get(name="Montcuq")
+        tip_data = {
+            "title": "test errors",
+            "text": "testing location errors",
+            "cities": [
+                {"id": city.id, "name": "Montcuq-en-Quercy"},
+                {"id": 0, "name": "Nowhere"},
+            ],
+            "countries": [{"id": city.country.id, "name": "Syldavia"}],
+        }
+        response = self.client.post(tips_url, tip_data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.data["cities"]), 2)
+        self.assertEqual(len(response.data["countries"]), 1)
+        self.assertFalse(Tip.objects.exists())
+
+    def test_batch_create(self):
+        city = City.objects.get(name="Montcuq")
+        tips_data = [
+            {
+                "title": "batch local",
+                "text": "first of the batch",
+                "cities": [{"id": city.id, "name": city.name}],
+            },
+            {
+                "title": "batch wrong city",
+                "text": "second of the batch",
+                "cities": [{"id": city.id, "name": "Montcuq-en-Quercy"}],
+            },
+            {
+                "text": "third of the batch, without title",
+            },
+            {
+                "title": "batch global",
+                "text": "fourth of the batch",
+            },
+        ]
+        response = self.client.post(tips_batch_url, tips_data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([result["status"] for result in response.data],
+                         [201, 400, 400, 201])
+        self.assertIn("cities", response.data[1]["errors"])
+        self.assertIn("title", response.data[2]["errors"])
+        self.assertEqual(response.data[0]["data"]["tipper"]["username"],
+                         "toto")
+        self.assertEqual(response.data[0]["data"]["cities"],
+                         [{"id": city.id, "name": city.name}])
+
+        response = self.client.get(tips_url, {"latitude": 127,
+                                              "longitude": 42})
+        self.assertEqual([tip["title"] for tip in response.data["results"]],
+                         ["batch local", "batch global"])
+
+    def test_location_index_follows_many_to_many_changes(self):
+        montcuq = City.objects.get(name="Montcuq")
+        trifouillis = City.objects.get(name="Trifouillis les Oies")
+        user = User.objects.get(username="toto")
+        tip = Tip.objects.create(title="linked", text="indexed", score=0,
+                                 tipper=user)
+
+        def index():
+            return set(TipLocation.objects.filter(tip=tip).values_list(
+                "level", "location_id"))
+
+        tip.cities.set([montcuq, trifouillis])
+        tip.countries.add(montcuq.country)
+        self.assertEqual(index(), {(TipLocation.CITY, montcuq.id),
+                                   (TipLocation.CITY, trifouillis.id),
+                                   (TipLocation.COUNTRY, montcuq.country_id)})
+        tip.cities.remove(trifouillis)
+        montcuq.tip_set.clear()
+        self.assertEqual(index(), {(TipLocation.COUNTRY, montcuq.country_id)})
+
+        # Once unlinked, the tip is global again.
+        tip.countries.clear()
+        response = self.client.get(tips_url)
+        self.assertEqual([result["title"]
+                          for result in response.data["results"]],
+                         ["linked"])
+
+    def test_deleted_location_leaves_index(self):
+        montcuq = City.objects.get(name="Montcuq")
+        user = User.objects.get(username="toto")
+        tip = Tip.objects.create(title="orphan", text="indexed", score=0,
+                                 tipper=user)
+        tip.cities.add(montcuq)
+        montcuq.delete()
+        self.assertFalse(TipLocation.objects.filter(tip=tip).exists())
+        response = self.client.get(tips_url)
+        self.assertEqual([result["title"]
+                          for result in response.data["results"]],
+                         ["orphan"])
+
+    def test_local_tips_ranking(self):
+        montcuq = City.objects.get(name="Montcuq")
+        trifouillis = City.objects.get(name="Trifouillis les Oies")
+        user = User.objects.get(username="toto")
+        country_tip = Tip.objects.create(title="country", text="ranked",
+                                         score=5, tipper=user)
+        country_tip.countries.add(montcuq.country)
+        both_tip = Tip.objects.create(title="both cities", text="ranked",
+                                      score=0, tipper=user)
+        both_tip.cities.add(montcuq, trifouillis)
+        global_tip = Tip.objects.create(title="global", text="ranked",
+                                        score=1, tipper=user)
+
+        response = self.client.get(tips_url, {"latitude": 127,
+                                              "longitude": 42})
+        results = response.data["results"]
+        # Closest and close city boosts are counted once each.
+        self.assertEqual([(tip["title"], tip["boost_score"])
+                          for tip in results],
+                         [("both cities", 300), ("country", 65),
+                          ("global", 1)])
+
+    @override_settings(TIP_RANKING_SIZE=11)
+    def test_local_tips_precomputed_ranking(self):
+        montcuq = City.objects.get(name="Montcuq")
+        user = User.objects.get(username="toto")
+        for score in range(12):
+            tip = Tip.objects.create(title="tip {}".format(score),
+                                     text="ranked", score=score, tipper=user)
+            tip.countries.add(montcuq.country)
+        data = {"latitude": 127, "longitude": 42}
+
+        def get_titles():
+            # The first page comes from the ranking, the second one from
+            # the database.
+            response = self.client.get(tips_url, data)
+            results = response.data["results"]
+            response = self.client.get(response.data["next"])
+            self.assertIsNone(response.data["next"])
+            results += response.data["results"]
+            self.assertEqual(
+                [tip["boost_score"] for tip in results],
+                sorted((tip["boost_score"] for tip in results), reverse=True))
+            return [tip["title"] for tip in results]
+
+        self.assertEqual(get_titles(),
+                         ["tip {}".format(score)
+                          for score in reversed(range(12))])
+
+        tip_data = {
+            "title": "new",
+            "text": "ranked",
+            "cities": [{"id": montcuq.id, "name": montcuq.name}],
+        }
+        self.client.post(tips_url, tip_data, format="json")
+        titles = get_titles()
+        self.assertEqual(len(titles), 13)
+        self.assertIn("new", titles)
+
+    def test_vote(self):
+        tip_data = {
+            "title": "test vote",
+            "text": "testing votes",
+        }
+        response = self.client.post(tips_url, tip_data, format="json")
+        tip_url = get_tip_put_url(response.data["id"])
+
+        response = self.client.post(tip_url + "vote/", {"value": 1},
+                                    format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(tip_url + "vote/", {"value": -1},
+                                    format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(tip_url + "vote/", {"value": 2},
+                                    format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Votes are only counted by the apply_votes worker.
+        response = self.client.get(tip_url)
+        self.assertEqual(response.data["score"], 0)
+        self.assertEqual(votes.apply_votes(), 1)
+        self.assertEqual(votes.apply_votes(), 0)
+        response = self.client.get(tip_url)
+        self.assertEqual(response.data["score"], 1)
+
+    def test_search(self):
+        montcuq = City.objects.get(name="Montcuq")
+        tips_data = [
+            {"title": "Compost", "text": "Composting kitchen waste"},
+            {"title": "Bikes", "text": "Ride a bike to work"},
+            {"title": "Local compost", "text": "Shared composters",
+             "cities": [{"id": montcuq.id, "name": montcuq.name}]},
+        ]
+        for tip_data in tips_data:
+            response = self.client.post(tips_url, tip_data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.get(tips_url, {"search": "composting"})
+        self.assertEqual([tip["title"] for tip in response.data["results"]],
+                         ["Compost"])
+
+        response = self.client.get(tips_url, {"search": "compost",
+                                              "latitude": 127,
+                                              "longitude": 42})
+        self.assertEqual([tip["title"] for tip in response.data["results"]],
+                         ["Local compost", "Compost"])
+
+    def test_area(self):
+        montcuq = City.objects.get(name="Montcuq")
+        tips_data = [
+            {"title": "global", "text": "everywhere"},
+            {"title": "local", "text": "in Montcuq",
+             "cities": [{"id": montcuq.id, "name": montcuq.name}]},
+        ]
+        for tip_data in tips_data:
+            self.client.post(tips_url, tip_data, format="json")
+
+        response = self.client.get(tips_area_url, {"bbox": "41,126,43,128"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data
+        self.assertIsNone(data["next"])
+        self.assertEqual([(tip["title"], tip["points"])
+                          for tip in data["results"]],
+                         [("local", [{"longitude": 42, "latitude": 127}])])
+
+        response = self.client.get(tips_area_url, {"bbox": "1,1,0,0"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(tips_area_url, {"bbox": "0,0,1,1"})
+        self.assertEqual(response.data["results"], [])
+
+    def test_clusters(self):
+        region = Region.objects.get()
+        paris = City.objects.create(name="Paris", region=region,
+                                    country=region.country,
+                                    location=Point(2.35, 48.85),
+                                    population=2000000)
+        tip_data = {
+            "title": "cluster",
+            "text": "counted",
+            "cities": [{"id": paris.id, "name": paris.name}],
+        }
+        self.client.post(tips_url, tip_data, format="json")
+
+        response = self.client.get(clusters_url.format(0, 0, 0))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["level"], "region")
+        self.assertEqual([(cluster["name"], cluster["count"])
+                          for cluster in response.data["clusters"]],
+                         [(region.name, 1)])
+
+        # Cached clusters are invalidated by new tips.
+        self.client.post(tips_url, tip_data, format="json")
+        response = self.client.get(clusters_url.format(12, 2074, 1409))
+        self.assertEqual(response.data["level"], "city")
+        self.assertEqual([(cluster["id"], cluster["count"])
+                          for cluster in response.data["clusters"]],
+                         [(paris.id, 2)])
+        response = self.client.get(clusters_url.format(0, 0, 0))
+        self.assertEqual(response.data["clusters"][0]["count"], 2)
+
+        # Region tips are counted in the region, not in its cities.
+        tip_data = {
+            "title": "region cluster",
+            "text": "counted",
+            "regions": [{"id": region.id, "name": region.name}],
+        }
+        self.client.post(tips_url, tip_data, format="json")
+        response = self.client.get(clusters_url.format(0, 0, 0))
+        self.assertEqual([(cluster["id"], cluster["count"])
+                          for cluster in response.data["clusters"]],
+                         [(region.id, 3)])
+        response = self.client.get(clusters_url.format(12, 2074, 1409))
+        self.assertEqual(response.data["clusters"][0]["count"], 2)
+
+        response = self.client.get(clusters_url.format(1, 2, 0))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_city_search(self):
+        montcuq = City.objects.get(name="Montcuq")
+        response = self.client.get(cities_url + "search/", {"q": "MONTC"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([city["id"] for city in response.data],
+                         [montcuq.id])
+
+        # Cities of a matching country, most populated first.
+        response = self.client.get(cities_url + "search/",
+                                   {"q": "bachibouzouc", "limit": 1})
+        self.assertEqual([city["name"] for city in response.data],
+                         ["Montcuq"])
+
+    def test_conditional_get(self):
+        city = City.objects.get(name="Montcuq")
+        data = {"latitude": 127, "longitude": 42}
+        response = self.client.get(tips_url, data)
+        etag = response["ETag"]
+        response = self.client.get(tips_url, data, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        tip_data = {
+            "title": "test etag",
+            "text": "testing conditional requests",
+            "cities": [{"id": city.id, "name": city.name}],
+        }
+        self.client.post(tips_url, tip_data, format="json")
+        response = self.client.get(tips_url, data, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+        response = self.client.get(cities_url)
+        etag = response["ETag"]
+        response = self.client.get(cities_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        city.population += 1
+        city.save()
+        response = self.client.get(cities_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_anonymous_feed_cache_invalidation(self):
+        city = City.objects.get(name="Montcuq")
+        self.client.credentials()
+        data = {"latitude": 127, "longitude": 42}
+        response = self.client.get(tips_url, data)
+        self.assertEqual(response.data["results"], [])
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        tip_data = {
+            "title": "test cache",
+            "text": "testing cache invalidation",
+            "cities": [{"id": city.id, "name": city.name}],
+        }
+        response = self.client.post(tips_url, tip_data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.client.credentials()
+        response = self.client.get(tips_url, data)
+        self.assertEqual([tip["title"] for tip in response.data["results"]],
+                         ["test cache"])
+
 
-class PermissionTests(APITestCase):
+class PermissionTests(TipsAPITestCase):
     """Validate permissions.
     """
 
     def setUp(self):
+        super().setUp()
         self.user1 = TestUser("toto", "toto@test.com", "weshwesh")
         self.user2 = TestUser("titi", "titi@test.com", "pouetpouet")
         self.user1.register(self.client)
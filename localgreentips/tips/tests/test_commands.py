@@ -0,0 +1,146 @@
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.management import call_command
+from django.test import LiveServerTestCase, TestCase
+from django.test.runner import DiscoverRunner
+
+from cities.models import Country, Region, City
+
+from localgreentips.tips.models import Tip, TipLocation
+
+
+class TransferTipsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="exporter")
+        self.country = Country.objects.create(name="Syldavie",
+                                              population=642000)
+        region = Region.objects.create(name="Klow", country=self.country)
+        self.city = City.objects.create(
+            name="Niedzdrow", region=region, country=self.country,
+            location=Point(20, 45), population=1200)
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for name in os.listdir(self.tmpdir):
+            os.remove(os.path.join(self.tmpdir, name))
+        os.rmdir(self.tmpdir)
+
+    def test_export_import_ndjson(self):
+        tip = Tip.objects.create(title="local", text="exported", score=3,
+                                 tipper=self.user)
+        tip.cities.add(self.city)
+        Tip.objects.create(title="global", text="exported", score=1)
+        path = os.path.join(self.tmpdir, "tips.ndjson")
+
+        call_command("export_tips", path, stdout=io.StringIO())
+        with open(path) as exported:
+            rows = [json.loads(line) for line in exported]
+        self.assertEqual([row["title"] for row in rows], ["local", "global"])
+        self.assertEqual(rows[0]["cities"],
+                         [{"id": self.city.id, "name": self.city.name}])
+
+        Tip.objects.all().delete()
+        call_command("import_tips", path, chunk_size=1,
+                     stdout=io.StringIO())
+        imported = Tip.objects.get(title="local")
+        self.assertEqual(imported.tipper, self.user)
+        self.assertEqual(list(imported.cities.all()), [self.city])
+        self.assertEqual(
+            list(TipLocation.objects.filter(tip=imported).values_list(
+                "level", "location_id")),
+            [(TipLocation.CITY, self.city.id)])
+        self.assertTrue(Tip.objects.filter(title="global").exists())
+
+    def test_import_csv_by_name(self):
+        path = os.path.join(self.tmpdir, "tips.csv")
+        with open(path, "w") as csv_file:
+            csv_file.write(
+                "title,text,score,tipper,cities,countries\n"
+                "by name,imported,2,exporter,Niedzdrow,Syldavie\n"
+                "unknown,imported,2,,Atlantis,\n")
+
+        stderr = io.StringIO()
+        call_command("import_tips", path, stdout=io.StringIO(),
+                     stderr=stderr)
+        tip = Tip.objects.get()
+        self.assertEqual(tip.title, "by name")
+        self.assertEqual(list(tip.countries.all()), [self.country])
+        self.assertIn("Skipping row 2", stderr.getvalue())
+
+    def test_import_skips_invalid_rows(self):
+        path = os.path.join(self.tmpdir, "tips.ndjson")
+        rows = [
+            {"title": "valid", "text": "imported",
+             "cities": [{"id": str(self.city.id)}]},
+            ["not", "an", "object"],
+            {"title": "bad score", "text": "imported", "score": "lots"},
+            {"title": "bad city", "text": "imported",
+             "cities": [{"id": "Niedzdrow"}]},
+            {"title": "long" * 100, "text": "imported"},
+        ]
+        with open(path, "w") as ndjson_file:
+            for row in rows:
+                ndjson_file.write(json.dumps(row) + "\n")
+            ndjson_file.write("{truncated\n")
+
+        stderr = io.StringIO()
+        call_command("import_tips", path, stdout=io.StringIO(),
+                     stderr=stderr)
+        tip = Tip.objects.get()
+        self.assertEqual(tip.title, "valid")
+        self.assertEqual(list(tip.cities.all()), [self.city])
+        for number in range(2, 7):
+            self.assertIn("Skipping row {}".format(number), stderr.getvalue())
+
+    def test_prune_tip_locations(self):
+        tip = Tip.objects.create(title="local", text="pruned", score=0,
+                                 tipper=self.user)
+        tip.cities.add(self.city)
+        # Rows left behind by locations deleted without signals
+        TipLocation.objects.create(tip=tip, level=TipLocation.REGION,
+                                   location_id=0)
+
+        call_command("prune_tip_locations", stdout=io.StringIO())
+        self.assertEqual(
+            list(TipLocation.objects.values_list("level", "location_id")),
+            [(TipLocation.CITY, self.city.id)])
+
+
+class BenchmarkTests(TestCase):
+
+    def test_benchmark_api(self):
+        # The command runs in the database of the test instead of creating
+        # its own test database.
+        with mock.patch.multiple(
+                DiscoverRunner, setup_test_environment=mock.DEFAULT,
+                teardown_test_environment=mock.DEFAULT,
+                setup_databases=mock.DEFAULT,
+                teardown_databases=mock.DEFAULT), \
+                tempfile.NamedTemporaryFile(suffix=".json") as output:
+            call_command("benchmark_api", tips=20, cities=10, iterations=1,
+                         output=output.name, stdout=io.StringIO())
+            results = json.load(output)
+        self.assertEqual(results["scale"], {"tips": 20, "cities": 10})
+        self.assertIn("tip_update", results["scenarios"])
+        for result in results["scenarios"].values():
+            self.assertEqual(result["iterations"], 1)
+            self.assertGreater(result["queries"], 0)
+
+
+class LoadTestTests(LiveServerTestCase):
+
+    def test_load_test(self):
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            call_command("load_test", self.live_server_url, path=["/tips/"],
+                         requests=6, concurrency=2, output=output.name,
+                         stdout=io.StringIO())
+            results = json.load(output)
+        self.assertEqual(results["requests"], 6)
+        self.assertEqual(results["errors"], 0)
@@ -0,0 +1,136 @@
+import unittest
+
+from django.contrib.gis.geos import Point
+from django.test import SimpleTestCase, TestCase
+
+from cities.models import Country, Region, City
+
+from localgreentips.tips import locations, spatial, typeahead
+from localgreentips.tips.models import TipLocation
+
+
+class LRUCacheTests(SimpleTestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = locations.LRUCache(max_size=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_expires_entries(self):
+        cache = locations.LRUCache(max_size=2, ttl=-1)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+
+class ResolveLocationTests(TestCase):
+
+    def setUp(self):
+        country = Country.objects.create(name="Syldavie", population=642000)
+        region = Region.objects.create(name="Klow", country=country)
+        self.city = City.objects.create(
+            name="Niedzdrow", region=region, country=country,
+            location=Point(20, 45), population=1200)
+
+    def test_resolve_location(self):
+        resolved = locations.resolve_location(20.001, 45.001)
+        self.assertEqual(resolved.closest_city_id, self.city.id)
+        self.assertEqual(resolved.region_id, self.city.region_id)
+        self.assertEqual(resolved.country_id, self.city.country_id)
+        self.assertEqual(resolved.close_city_ids, ())
+
+    def test_resolve_location_is_cached_per_cell(self):
+        locations.resolve_location(20.001, 45.001)
+        with self.assertNumQueries(0):
+            resolved = locations.resolve_location(20.002, 45.002)
+        self.assertEqual(resolved.closest_city_id, self.city.id)
+
+    def test_resolve_location_nothing_nearby(self):
+        self.assertIsNone(locations.resolve_location(-20, -45))
+
+
+@unittest.skipIf(spatial.numpy is None, "numpy and scipy are not installed")
+class CityIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        # Paris, Versailles, Lyon
+        self.index = spatial.CityIndex(
+            [1, 2, 3], [2.3522, 2.1301, 4.8357], [48.8566, 48.8049, 45.7640])
+
+    def test_nearest_within_radius(self):
+        nearest = self.index.nearest(2.35, 48.85, radius_km=50)
+        self.assertEqual([pk for pk, distance in nearest], [1, 2])
+        self.assertAlmostEqual(nearest[1][1], 17.0, delta=1)
+
+    def test_nearest_limit(self):
+        nearest = self.index.nearest(2.35, 48.85, radius_km=500, limit=2)
+        self.assertEqual([pk for pk, distance in nearest], [1, 2])
+        nearest = self.index.nearest(2.35, 48.85, radius_km=1000)
+        self.assertEqual([pk for pk, distance in nearest], [1, 2, 3])
+        self.assertAlmostEqual(nearest[2][1], 392, delta=5)
+
+    def test_nearest_nothing_in_radius(self):
+        self.assertEqual(self.index.nearest(-70, -30, radius_km=100), [])
+
+
+class NameIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        cities = [
+            (1, 2000000, 2.35, 48.85, None, 10, 100),
+            (2, 500, 2.5, 48.9, None, 10, 100),
+            (3, 8000000, -74, 40.7, None, 20, 200),
+            (4, 170000, 4.39, 45.43, None, 10, 100),
+        ]
+        names = [
+            ("Paris", (TipLocation.CITY, 1)),
+            ("Parisot", (TipLocation.CITY, 2)),
+            ("New York", (TipLocation.CITY, 3)),
+            ("Saint-Étienne", (TipLocation.CITY, 4)),
+            ("France", (TipLocation.COUNTRY, 100)),
+        ]
+        # Enough names for the searches to go through sorted blocks.
+        for pk in range(10, 10 + 2 * typeahead.BLOCK_SIZE):
+            cities.append((pk, pk, 0, 0, None, None, None))
+            names.append(("Pa {}".format(pk), (TipLocation.CITY, pk)))
+        alt_names = [
+            ("Lutèce", (TipLocation.CITY, 1)),
+            ("Big Apple", (TipLocation.CITY, 3)),
+        ]
+        self.index = typeahead.NameIndex(names, alt_names, cities)
+
+    def test_prefix(self):
+        self.assertEqual(self.index.search("par", 2), [1, 2])
+        last = 10 + 2 * typeahead.BLOCK_SIZE - 1
+        self.assertEqual(self.index.search("Pa", 3), [1, last, last - 1])
+        self.assertEqual(self.index.search("", 2), [])
+
+    def test_accents_alternate_names_and_words(self):
+        self.assertEqual(self.index.search("LUTECE", 2), [1])
+        self.assertEqual(self.index.search("saint etie", 2), [4])
+        self.assertEqual(self.index.search("york", 2), [3])
+        self.assertEqual(self.index.search("big", 2), [3])
+        # Alternate names are only indexed from their start.
+        self.assertEqual(self.index.search("apple", 2), [])
+
+    def test_area_names(self):
+        self.assertEqual(self.index.search("fran", 3), [1, 4, 2])
+
+    def test_proximity(self):
+        self.assertEqual(self.index.search("paris", 2, 2.5, 48.9), [1, 2])
+        self.assertEqual(self.index.search("f", 2, 4.39, 45.43), [4, 1])
+
+    def test_nearby_cities(self):
+        # Parisot is too little populated to be among the most populated
+        # matches, it is found as a city near the position.
+        last = 10 + 2 * typeahead.BLOCK_SIZE - 1
+        self.assertEqual(self.index.search("pa", 2, 2.5, 48.9), [1, last])
+        self.assertEqual(
+            self.index.search("pa", 2, 2.5, 48.9, nearby_ids=[2, 4]), [1, 2])
+        self.assertEqual(
+            self.index.search("ris", 2, 2.5, 48.9, nearby_ids=[2]), [])
@@ -0,0 +1,152 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITransactionTestCase
+
+from cities.models import City
+from rest_framework.authtoken.models import Token
+
+from localgreentips.tips import routers
+from localgreentips.tips.models import Tip
+
+tips_url = "/tips/"
+
+
+@override_settings(REPLICA_DATABASES=['replica1'])
+class ReplicaRoutingTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.router = routers.ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def read_databases(self, request):
+        """Databases of reads made while the middleware handles request.
+        """
+        databases = {}
+
+        def get_response(request):
+            for model in (Tip, City, Token):
+                databases[model] = self.router.db_for_read(model)
+            return None
+
+        routers.ReplicaMiddleware(get_response)(request)
+        return databases
+
+    def test_safe_requests_read_from_replicas(self):
+        databases = self.read_databases(self.factory.get("/tips/"))
+        self.assertEqual(databases, {Tip: "replica1", City: "replica1",
+                                     Token: "default"})
+        self.assertEqual(self.router.db_for_read(Tip), "default")
+        self.assertEqual(self.router.db_for_write(Tip), "default")
+
+        databases = self.read_databases(self.factory.post("/tips/"))
+        self.assertEqual(databases[Tip], "default")
+
+    def test_reads_stick_to_default_after_write(self):
+        authorization = {"HTTP_AUTHORIZATION": "Token writer"}
+        self.read_databases(self.factory.post("/tips/", **authorization))
+
+        databases = self.read_databases(
+            self.factory.get("/tips/", **authorization))
+        self.assertEqual(databases[Tip], "default")
+        databases = self.read_databases(
+            self.factory.get("/tips/", HTTP_AUTHORIZATION="Token reader"))
+        self.assertEqual(databases[Tip], "replica1")
+
+    @override_settings(REPLICA_DATABASES=['replica1', 'replica2'])
+    def test_one_replica_per_request(self):
+        for _ in range(10):
+            request = self.factory.get("/tips/")
+
+            def get_response(request):
+                replica = self.router.db_for_read(Tip)
+                for _ in range(10):
+                    self.assertEqual(self.router.db_for_read(Tip), replica)
+                    self.assertEqual(self.router.db_for_read(City), replica)
+                return None
+
+            routers.ReplicaMiddleware(get_response)(request)
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_no_replicas(self):
+        databases = self.read_databases(self.factory.get("/tips/"))
+        self.assertEqual(databases[Tip], "default")
+
+    def test_cache_filling_reads_use_default(self):
+        def get_response(request):
+            with routers.use_default():
+                self.assertEqual(self.router.db_for_read(Tip), "default")
+            self.assertEqual(self.router.db_for_read(Tip), "replica1")
+            return None
+
+        routers.ReplicaMiddleware(get_response)(self.factory.get("/tips/"))
+
+    def test_parse_lsn(self):
+        self.assertEqual(routers.parse_lsn("0/0"), 0)
+        self.assertEqual(routers.parse_lsn("16/B374D848"),
+                         (0x16 << 32) + 0xB374D848)
+
+
+@override_settings(REPLICA_DATABASES=["replica1"])
+class ReplicaReadsTests(APITransactionTestCase):
+    """Requests reading from a replica which is the test database.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.databases["replica1"] = dict(
+            connections["default"].settings_dict)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections["replica1"].close()
+        del connections["replica1"]
+        del connections.databases["replica1"]
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create(username="replicated")
+        Tip.objects.create(title="replicated", text="read from a replica",
+                           tipper=user)
+
+    def get_feed(self):
+        """Get the feed, with the tip queries made on each database.
+        """
+        with CaptureQueriesContext(connections["default"]) as default, \
+                CaptureQueriesContext(connections["replica1"]) as replica:
+            response = self.client.get(tips_url)
+        self.assertEqual([tip["title"] for tip in response.data["results"]],
+                         ["replicated"])
+        return response, {
+            alias: [query["sql"] for query in queries.captured_queries
+                    if "tips_tip" in query["sql"]]
+            for alias, queries in (("default", default),
+                                   ("replica1", replica))}
+
+    def test_feed_reads_from_replica(self):
+        response, queries = self.get_feed()
+        self.assertEqual(queries["default"], [])
+        self.assertTrue(queries["replica1"])
+        # The test database is not a standby, so it is never lagging.
+        self.assertIn("ETag", response)
+
+        # The feed was cached.
+        response, queries = self.get_feed()
+        self.assertEqual(queries, {"default": [], "replica1": []})
+
+    def test_lagging_replica(self):
+        with mock.patch.object(routers, "replica_position", return_value=0):
+            response, queries = self.get_feed()
+            self.assertTrue(queries["replica1"])
+            self.assertNotIn("ETag", response)
+
+            # Nothing read from the lagging replica was cached.
+            response, queries = self.get_feed()
+            self.assertTrue(queries["replica1"])
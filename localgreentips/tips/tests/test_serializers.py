@@ -0,0 +1,75 @@
+import json
+
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.db.models import F
+from django.test import TestCase
+
+from cities.models import Country, Region, Subregion, City
+
+from localgreentips.tips.models import Tip
+from localgreentips.tips.serializers import (
+    CITY_VALUES, CityNestedSerializer, TipSerializer, serialize_cities)
+
+
+class CitySerializationTests(TestCase):
+
+    def setUp(self):
+        country = Country.objects.create(name="Syldavie", population=642000)
+        region = Region.objects.create(name="Klow", country=country)
+        subregion = Subregion.objects.create(name="Zileheroum",
+                                             region=region)
+        City.objects.create(
+            name="Niedzdrow", region=region, country=country,
+            subregion=subregion, location=Point(20, 45), population=1200)
+        City.objects.create(
+            name="Douma", region=region, country=country,
+            location=Point(21, 45), population=800)
+
+    def test_serialize_cities_parity(self):
+        cities = City.objects.order_by("pk")
+        expected = CityNestedSerializer(cities, many=True).data
+        with self.assertNumQueries(1):
+            data = serialize_cities(cities.values_list(*CITY_VALUES))
+        self.assertEqual(json.dumps(data), json.dumps(expected))
+
+
+class TipSerializationTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(username="serializer")
+        country = Country.objects.create(name="Borduria", population=1000)
+        region = Region.objects.create(name="Szohôd", country=country)
+        subregion = Subregion.objects.create(name="Tchimmedje",
+                                             region=region)
+        cities = [
+            City.objects.create(
+                name=name, region=region, country=country,
+                subregion=subregion, location=Point(20, 45), population=10)
+            for name in ("Szohôd", "Tchimmedje", "Zlotzna")]
+
+        local = Tip.objects.create(title="local", text="everywhere",
+                                   score=3, tipper=user)
+        local.cities.add(cities[0])
+        local.subregions.add(subregion)
+        local.regions.add(region)
+        local.countries.add(country)
+        other = Tip.objects.create(title="other", text="elsewhere",
+                                   score=1, tipper=user)
+        other.cities.add(cities[2])
+        Tip.objects.create(title="global", text="no tipper", score=0)
+
+    def test_list_serializer_parity(self):
+        tips = list(Tip.objects.order_by("pk"))
+        expected = [TipSerializer(tip).data for tip in tips]
+        with self.assertNumQueries(5):
+            data = TipSerializer(tips, many=True).data
+        self.assertEqual(json.dumps(data), json.dumps(expected))
+
+    def test_list_serializer_parity_with_boost_score(self):
+        tips = list(Tip.objects.annotate(boost_score=F("score") * 2)
+                    .select_related("tipper").order_by("pk"))
+        expected = [TipSerializer(tip).data for tip in tips]
+        with self.assertNumQueries(4):
+            data = TipSerializer(tips, many=True).data
+        self.assertEqual(json.dumps(data), json.dumps(expected))
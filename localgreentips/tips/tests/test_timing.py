@@ -0,0 +1,44 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from localgreentips.tips import timing
+
+
+@override_settings(TIMING_SAMPLE_RATE=1.0)
+class TimingTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        timing.stats.clear()
+
+    def test_server_timing_header(self):
+        response = self.client.get("/tips/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        metrics = [metric.split(";")[0]
+                   for metric in response["Server-Timing"].split(", ")]
+        self.assertIn("resolve", metrics)
+        self.assertIn("ranking", metrics)
+        self.assertIn("serialize", metrics)
+        self.assertEqual(metrics[-2:], ["db", "total"])
+
+    @override_settings(TIMING_SAMPLE_RATE=0.0)
+    def test_not_sampled(self):
+        response = self.client.get("/tips/")
+        self.assertNotIn("Server-Timing", response)
+
+    def test_stats(self):
+        self.client.get("/tips/")
+        response = self.client.get("/stats/timing/")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        admin = User.objects.create_superuser(
+            "admin", "admin@test.com", "pouetpouet")
+        self.client.force_authenticate(admin)
+        response = self.client.get("/stats/timing/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        route = response.data["routes"]["GET tip-list"]
+        self.assertEqual(route["total"]["count"], 1)
+        self.assertIn("ranking", route["phases"])
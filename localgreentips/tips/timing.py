@@ -0,0 +1,188 @@
+"""Per request timing of the phases of the API views and of their queries.
+
+TimingMiddleware samples requests according to TIMING_SAMPLE_RATE. For a
+sampled request, the views time their phases with the phase context manager
+and every database query is attributed to the innermost running phase. The
+timings are returned in a Server-Timing header and aggregated per route in
+histograms served by TimingStatsView.
+"""
+import bisect
+import contextlib
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connections
+
+# Upper bounds in milliseconds of the histogram buckets, the last one being
+# for everything slower.
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_local = threading.local()
+
+
+class RequestTimer:
+    """Timings of the phases of one request.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = OrderedDict()
+        self.running = []
+        self.queries = 0
+        self.queries_time = 0.0
+
+    def _get_phase(self, name):
+        return self.phases.setdefault(
+            name, {'time': 0.0, 'queries': 0, 'queries_time': 0.0})
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        self._get_phase(name)
+        self.running.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name]['time'] += time.perf_counter() - start
+            self.running.pop()
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.queries_time += duration
+            if self.running:
+                phase = self.phases[self.running[-1]]
+                phase['queries'] += 1
+                phase['queries_time'] += duration
+
+    def server_timing(self, total):
+        metrics = ['{};dur={:.2f};desc="{} queries"'.format(
+            name, phase['time'] * 1000, phase['queries'])
+            for name, phase in self.phases.items()]
+        metrics.append('db;dur={:.2f};desc="{} queries"'.format(
+            self.queries_time * 1000, self.queries))
+        metrics.append('total;dur={:.2f}'.format(total * 1000))
+        return ', '.join(metrics)
+
+
+def get_timer():
+    return getattr(_local, 'timer', None)
+
+
+def phase(name):
+    """Context manager timing a phase of the current request, if sampled.
+    """
+    timer = get_timer()
+    if timer is None:
+        return contextlib.suppress()
+    return timer.phase(name)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.total_ms = 0.0
+
+    def add(self, value_ms):
+        self.counts[bisect.bisect_left(BUCKETS_MS, value_ms)] += 1
+        self.total_ms += value_ms
+
+    def as_dict(self):
+        count = sum(self.counts)
+        return {
+            'count': count,
+            'mean_ms': self.total_ms / count if count else None,
+            'buckets': OrderedDict(
+                [('le_{}'.format(bound), self.counts[index])
+                 for index, bound in enumerate(BUCKETS_MS)] +
+                [('gt_{}'.format(BUCKETS_MS[-1]), self.counts[-1])]),
+        }
+
+
+class RouteStats:
+    def __init__(self):
+        self.total = Histogram()
+        self.db = Histogram()
+        self.queries = 0
+        self.phases = OrderedDict()
+
+    def add(self, timer, total):
+        self.total.add(total * 1000)
+        self.db.add(timer.queries_time * 1000)
+        self.queries += timer.queries
+        for name, phase in timer.phases.items():
+            self.phases.setdefault(name, Histogram()).add(
+                phase['time'] * 1000)
+
+    def as_dict(self):
+        requests = sum(self.total.counts)
+        return {
+            'total': self.total.as_dict(),
+            'db': self.db.as_dict(),
+            'mean_queries': self.queries / requests if requests else None,
+            'phases': OrderedDict((name, histogram.as_dict())
+                                  for name, histogram in self.phases.items()),
+        }
+
+
+class TimingStats:
+    """Timings of the sampled requests of this process, by route.
+    """
+    def __init__(self):
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def add(self, route, timer, total):
+        with self.lock:
+            self.routes.setdefault(route, RouteStats()).add(timer, total)
+
+    def as_dict(self):
+        with self.lock:
+            return OrderedDict((route, self.routes[route].as_dict())
+                               for route in sorted(self.routes))
+
+    def clear(self):
+        with self.lock:
+            self.routes.clear()
+
+
+stats = TimingStats()
+
+
+def get_route(request):
+    match = getattr(request, 'resolver_match', None)
+    view_name = match.view_name if match else 'unknown'
+    return '{} {}'.format(request.method, view_name)
+
+
+class TimingMiddleware:
+    """Time sampled requests, see the module documentation.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.TIMING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        timer = RequestTimer()
+        _local.timer = timer
+        try:
+            with contextlib.ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timer.record_query))
+                response = self.get_response(request)
+        finally:
+            _local.timer = None
+
+        total = time.perf_counter() - timer.start
+        response['Server-Timing'] = timer.server_timing(total)
+        stats.add(get_route(request), timer, total)
+        return response
@@ -0,0 +1,257 @@
+"""In-memory prefix index over city names for typeahead searches.
+
+Names of cities, subregions, regions and countries, with their alternate
+names, are transliterated to lower case ASCII and kept in a sorted list, so
+that the names starting with a query are found by bisection. Primary names
+are also indexed from each of their words, so that "york" finds "New York",
+alternate names only from their start. A city name matches the city, an
+area name matches the most populated cities of the area.
+
+Entries are grouped in blocks sorted by population, to find the most
+populated matches of short queries without going through all of them.
+Cities near the given coordinates whose name matches are added to these
+candidates, which are then ranked by population, reduced with the distance
+to the coordinates.
+
+Each entry takes about MEMORY_PER_NAME bytes, the size of the index is
+logged when it is built. Like the city index, each worker builds its own
+index the first time it is needed, see indexes.WorkerIndex, and rebuilds it
+when refresh_city_index is run. Set CITY_INDEX_PRELOAD to build it when the
+WSGI application is loaded rather than in the first request.
+"""
+import bisect
+import heapq
+import itertools
+import logging
+import re
+import sys
+
+from django.conf import settings
+from django.db.models import F, FloatField, Func
+from unidecode import unidecode
+
+from cities.models import City, Country, Region, Subregion
+
+from . import indexes
+from .models import TipLocation
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'tips:typeahead_version'
+# Kinds of alternate names indexed, links are left out.
+ALT_NAME_KINDS = ('name', 'abbr')
+# Most populated cities matched by an area name
+AREA_CITIES = 20
+BLOCK_SIZE = 512
+# Matching names considered per result
+CANDIDATES_PER_RESULT = 5
+# Cities near the searching position whose name is checked against the query
+NEARBY_CITIES = 200
+# Approximate bytes taken by an indexed name with its share of the cities,
+# measured with tracemalloc on 25000 cities having ten alternate names.
+MEMORY_PER_NAME = 200
+
+_NON_ALPHANUMERIC = re.compile('[^a-z0-9]+')
+
+
+def normalize(name):
+    """Lower case ASCII words of a name, separated by single spaces.
+    """
+    return _NON_ALPHANUMERIC.sub(' ', unidecode(name).lower()).strip()
+
+
+def _names(model, level, fields):
+    for row in model.objects.values_list('pk', *fields).iterator():
+        for name in row[1:]:
+            yield name, (level, row[0])
+
+
+def _alt_names(model, level):
+    through = model.alt_names.through
+    rows = through.objects.filter(
+        alternativename__kind__in=ALT_NAME_KINDS).values_list(
+            model._meta.model_name + '_id', 'alternativename__name')
+    for pk, name in rows.iterator():
+        yield name, (level, pk)
+
+
+class NameIndex:
+    """Sorted names, with the cities or areas they refer to.
+    """
+    def __init__(self, names, alt_names, cities):
+        """Build the index from (name, (level, id)) and city tuples.
+
+        Names are indexed from each of their words, alternate names from
+        their start. Cities are (id, population, longitude, latitude,
+        subregion id, region id, country id).
+        """
+        self.cities = {}
+        area_cities = {}
+        for pk, population, longitude, latitude, *areas in cities:
+            self.cities[pk] = (population or 0, longitude, latitude)
+            for level, area_id in zip(
+                    (TipLocation.SUBREGION, TipLocation.REGION,
+                     TipLocation.COUNTRY), areas):
+                if area_id is not None:
+                    area_cities.setdefault((level, area_id), []).append(pk)
+        self.area_cities = {
+            area: tuple(heapq.nlargest(AREA_CITIES, pks,
+                                       key=lambda pk: self.cities[pk][0]))
+            for area, pks in area_cities.items()
+        }
+
+        refs = {}
+        # Normalized names of each city, with a leading space so that a
+        # query is found at the start of one of their words.
+        self.city_names = {}
+        for name, ref in names:
+            key = normalize(name or '')
+            if not key:
+                continue
+            if ref[0] == TipLocation.CITY:
+                city_names = self.city_names.setdefault(ref[1], ())
+                if ' ' + key not in city_names:
+                    self.city_names[ref[1]] = city_names + (' ' + key,)
+            words = key.split(' ')
+            for start in range(len(words)):
+                refs.setdefault(' '.join(words[start:]), set()).add(ref)
+        for name, ref in alt_names:
+            key = normalize(name or '')
+            if key:
+                refs.setdefault(key, set()).add(ref)
+        self.keys = sorted(refs)
+        self.refs = [tuple(refs[key]) for key in self.keys]
+        self.populations = [max(self.ref_population(ref) for ref in entry)
+                            for entry in self.refs]
+        self.blocks = [
+            sorted(range(start, min(start + BLOCK_SIZE, len(self.keys))),
+                   key=self.populations.__getitem__, reverse=True)
+            for start in range(0, len(self.keys), BLOCK_SIZE)
+        ]
+
+    @classmethod
+    def build(cls):
+        cities = City.objects.annotate(
+            longitude=Func(F('location'), function='ST_X',
+                           output_field=FloatField()),
+            latitude=Func(F('location'), function='ST_Y',
+                          output_field=FloatField()),
+        ).values_list('pk', 'population', 'longitude', 'latitude',
+                      'subregion_id', 'region_id', 'country_id').order_by()
+        names = itertools.chain(
+            _names(City, TipLocation.CITY, ('name', 'name_std')),
+            _names(Subregion, TipLocation.SUBREGION, ('name', 'name_std')),
+            _names(Region, TipLocation.REGION, ('name', 'name_std')),
+            _names(Country, TipLocation.COUNTRY, ('name',)),
+        )
+        alt_names = itertools.chain.from_iterable(
+            _alt_names(model, level) for model, level in (
+                (City, TipLocation.CITY),
+                (Subregion, TipLocation.SUBREGION),
+                (Region, TipLocation.REGION),
+                (Country, TipLocation.COUNTRY)))
+        index = cls(names, alt_names, cities.iterator())
+        logger.info("City name index takes about %d MB",
+                    index.memory_size() // 2 ** 20)
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    def memory_size(self):
+        """Approximate bytes taken by the names of the index.
+        """
+        entries = (self.keys, self.refs, self.populations, self.blocks)
+        size = sum(map(sys.getsizeof, entries))
+        size += sum(map(sys.getsizeof, self.keys))
+        size += sum(map(sys.getsizeof, self.refs))
+        size += sum(map(sys.getsizeof, self.blocks))
+        size += sum(sys.getsizeof(name) for names in self.city_names.values()
+                    for name in names)
+        return size
+
+    def ref_population(self, ref):
+        level, pk = ref
+        if level == TipLocation.CITY:
+            city = self.cities.get(pk)
+        else:
+            cities = self.area_cities.get(ref)
+            city = self.cities[cities[0]] if cities else None
+        return city[0] if city else 0
+
+    def ref_cities(self, ref):
+        level, pk = ref
+        if level == TipLocation.CITY:
+            return (pk,) if pk in self.cities else ()
+        return self.area_cities.get(ref, ())
+
+    def _matching_entries(self, prefix, count):
+        """Indexes of the most populated entries starting with prefix.
+        """
+        low = bisect.bisect_left(self.keys, prefix)
+        high = bisect.bisect_left(self.keys, prefix + '\uffff')
+        if high - low <= 2 * BLOCK_SIZE:
+            return heapq.nlargest(count, range(low, high),
+                                  key=self.populations.__getitem__)
+
+        first_block = -(-low // BLOCK_SIZE)
+        last_block = high // BLOCK_SIZE
+        edges = itertools.chain(
+            range(low, first_block * BLOCK_SIZE),
+            range(last_block * BLOCK_SIZE, high))
+        sorted_entries = [sorted(edges, key=self.populations.__getitem__,
+                                 reverse=True)]
+        sorted_entries.extend(self.blocks[first_block:last_block])
+        merged = heapq.merge(
+            *sorted_entries, key=lambda entry: -self.populations[entry])
+        return list(itertools.islice(merged, count))
+
+    def search(self, query, limit, longitude=None, latitude=None,
+               nearby_ids=()):
+        """Ids of the best cities matching query, best first.
+
+        nearby_ids are the cities near the coordinates, those with a name
+        matching the query are candidates even when they are too little
+        populated to be among the most populated matches.
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+
+        candidates = set()
+        for entry in self._matching_entries(
+                prefix, limit * CANDIDATES_PER_RESULT):
+            for ref in self.refs[entry]:
+                candidates.update(self.ref_cities(ref))
+        word_prefix = ' ' + prefix
+        candidates.update(
+            pk for pk in nearby_ids if pk in self.cities and any(
+                word_prefix in name for name in self.city_names.get(pk, ())))
+
+        def score(pk):
+            population, city_longitude, city_latitude = self.cities[pk]
+            if longitude is None or latitude is None:
+                return population
+            distance = indexes.haversine_km(longitude, latitude,
+                                            city_longitude, city_latitude)
+            return population / (
+                1 + (distance / settings.CITY_TYPEAHEAD_DISTANCE_KM) ** 2)
+
+        return heapq.nlargest(limit, sorted(candidates), key=score)
+
+
+_index = indexes.WorkerIndex('city name index', VERSION_KEY, NameIndex.build)
+
+
+def get_index():
+    """Return the name index of this worker, built or rebuilt when needed.
+    """
+    return _index.get()
+
+
+def invalidate():
+    _index.invalidate()
+
+
+def refresh_index():
+    _index.refresh()
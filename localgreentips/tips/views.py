@@ -1,121 +1,397 @@
-from django.contrib.gis.db.models.functions import Distance
-from django.db.models import IntegerField, Case, F, Value, When, Q
+from django.conf import settings
 from django.contrib.gis.geos import Point
-from django.contrib.gis.measure import D
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from cities.models import City
-from rest_framework import permissions, viewsets
-from rest_framework.exceptions import ValidationError
+from rest_framework import permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 import logging
 
-from .models import Tip
+from . import (
+    bulk, caching, clusters, locations, rankings, timing, typeahead)
+from .models import Tip, TipLocation
+from .pagination import TipAreaPagination, TipCursorPagination
 from .permissions import IsOwnerOrReadOnly
-from .serializers import TipSerializer
-from .serializers import CityNestedSerializer
+from .serializers import TipSerializer, VoteSerializer
+from .serializers import load_locations, pop_location_data
+from .serializers import CITY_VALUES, CityNestedSerializer, serialize_cities
 
 logger = logging.getLogger(__name__)
 
+
+def conditional_response(request, digest, version_keys, get_response):
+    """Answer 304 when the client has the digest ETag, else get_response().
+
+    get_response is given whether the reads of the request see the writes
+    counted by the versions of the digest, and returns the response and
+    whether it is current. The response is only tagged when it is, as it is
+    otherwise built from a lagging replica or a previous ranking.
+    """
+    etag = '"{}"'.format(digest)
+    if caching.etag_matches(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED,
+                        headers={'ETag': etag})
+    fresh = caching.is_fresh(caching.get_versions(version_keys))
+    response, current = get_response(fresh)
+    if current:
+        response['ETag'] = etag
+    return response
+
+
 class TipViewSet(viewsets.ModelViewSet):
-    queryset = Tip.objects.all().order_by('-score')
+    queryset = Tip.objects.defer('search_vector').order_by('-score')
     serializer_class = TipSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly)
+    pagination_class = TipCursorPagination
+
+    def get_resolved_location(self):
+        """Resolve the request position, or reuse the one from its cursor.
+        """
+        if not hasattr(self, 'resolved_location'):
+            with timing.phase('resolve'):
+                self.resolved_location = self._resolve_location()
+            logger.debug("Resolved location is %s", self.resolved_location)
+        return self.resolved_location
+
+    def _resolve_location(self):
+        has_cursor, resolved = self.paginator.get_cursor_location(
+            self.request)
+        if has_cursor:
+            return resolved
 
-    def get_queryset(self):
         longitude = self.request.query_params.get('longitude', None)
         latitude = self.request.query_params.get('latitude', None)
+        if not (longitude and latitude):
+            return None
+        return locations.resolve_location(float(longitude), float(latitude))
 
-        global_tips = Tip.objects.filter(
-            Q(cities=None) &
-            Q(subregions=None) &
-            Q(regions=None) &
-            Q(countries=None)
-        ).distinct()
+    def get_queryset(self):
+        if self.action != 'list':
+            # Tips are looked up by id whatever their location.
+            return Tip.objects.defer('search_vector')
 
-        if not (longitude and latitude):
-            queryset = global_tips
-            closest_city = None
-        else:
-            location = Point(float(longitude), float(latitude))
-            close_cities = City.objects.filter(
-                    location__distance_lte=(location, D(km=50))).annotate(
-                            distance=Distance('location', location))
-
-            close_cities = close_cities.order_by('distance')[:10]
-            closest_city = close_cities.first()
-            close_cities = close_cities[1:]
-            logger.debug("Looking tips in nearby cities %s", close_cities)
-            logger.debug("Closest city is %s", closest_city)
-
-            local_tips = Tip.objects.filter(
-                Q(cities=closest_city) |
-                Q(cities__in=close_cities) |
-                Q(subregions=closest_city.subregion) |
-                Q(regions=closest_city.region) |
-                Q(countries=closest_city.region.country)
-            ).distinct()
-
-            queryset = (local_tips | global_tips).distinct()
-
-        if closest_city:
-            queryset = queryset.annotate(
-                closest_city_score=Case(
-                    When(cities=closest_city,
-                         then=(F('score') + 1) * 200),
-                    default=0,
-                    output_field=IntegerField()),
-
-                close_cities_score=Case(
-                    When(cities__in=close_cities,
-                         then=(F('score') + 1) * 100),
-                    default=0,
-                    output_field=IntegerField()),
-
-                close_subregions_score=Case(
-                    When(subregions=closest_city.subregion,
-                         then=(F('score') + 1) * 50),
-                    default=0,
-                    output_field=IntegerField()),
-
-                close_regions_score=Case(
-                    When(regions=closest_city.region,
-                         then=(F('score') + 1) * 20),
-                    default=0,
-                    output_field=IntegerField()),
-
-                close_countries_score=Case(
-                    When(countries=closest_city.region.country,
-                         then=(F('score') + 1) * 10),
-                    default=0,
-                    output_field=IntegerField()))
-
-            queryset = queryset.annotate(
-                boost_score=(F('score') + F('closest_city_score') +
-                             F('close_cities_score') +
-                             F('close_subregions_score') +
-                             F('close_regions_score') +
-                             F('close_countries_score'))
-                )
-
-            return queryset.order_by('-boost_score', 'id').prefetch_related(
-                'cities', 'subregions', 'regions', 'countries').distinct()
+        return rankings.rank_tips(
+            self.get_resolved_location(),
+            self.get_search()).select_related('tipper')
+
+    def get_search(self):
+        return self.request.query_params.get('search', '').strip() or None
+
+    def list(self, request, *args, **kwargs):
+        # Feeds only depend on the resolved location, search and page.
+        resolved = self.get_resolved_location()
+        with timing.phase('cache'):
+            digest = caching.get_feed_digest(
+                resolved,
+                request.query_params.get(self.paginator.cursor_query_param),
+                self.get_search(),
+                request.get_host())
+        return conditional_response(
+            request, digest, caching.location_dependencies(resolved),
+            lambda fresh: self._cached_list(
+                request, digest, fresh, *args, **kwargs))
+
+    def _cached_list(self, request, digest, fresh, *args, **kwargs):
+        """Return the feed response, and whether it is current.
+        """
+        self.current = fresh
+        if request.user.is_authenticated:
+            response = self._list(request, *args, **kwargs)
+            return response, self.current
+
+        feed_key = caching.get_feed_key(digest)
+        with timing.phase('cache'):
+            data = caching.get_feed(feed_key)
+        if data is None:
+            data = self._list(request, *args, **kwargs).data
+            if self.current:
+                with timing.phase('cache'):
+                    caching.set_feed(feed_key, data)
+        return Response(data), self.current
+
+    def _list(self, request, *args, **kwargs):
+        resolved = self.get_resolved_location()
+        with timing.phase('ranking'):
+            page = self._paginate_ranked_tips(request, resolved)
+        with timing.phase('serialize'):
+            data = self.get_serializer(page, many=True).data
+        return self.get_paginated_response(data)
+
+    def _paginate_ranked_tips(self, request, resolved):
+        if self.get_search():
+            return self.paginate_queryset(self.get_queryset())
+
+        # Pages past the top tips of the feed are ranked by the database, as
+        # are the first ones while their first ranking is being built.
+        ranking, complete, current = rankings.get_ranking(resolved)
+        if ranking is None:
+            return self.paginate_queryset(self.get_queryset())
+        self.current = self.current and current
+        if complete or self.paginator.has_ranking_page(ranking, request):
+            tips = Tip.objects.defer('search_vector').select_related('tipper')
+            return self.paginator.paginate_ranking(
+                ranking, tips, request, view=self,
+                rank_field=None if resolved is None else 'boost_score')
+        return self.paginate_queryset(self.get_queryset())
+
+    @action(detail=True, methods=['post'],
+            permission_classes=(permissions.IsAuthenticated,))
+    def vote(self, request, pk=None):
+        """Vote up (1) or down (-1) for a tip, once per user.
+
+        The tip score is updated by the apply_votes worker, with the other
+        pending votes.
+        """
+        tip = self.get_object()
+        serializer = VoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            with transaction.atomic():
+                serializer.save(tip=tip, user=request.user)
+        except IntegrityError:
+            raise ValidationError("You already voted for this tip.")
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Create a list of tips at once.
+
+        Every tip is validated, then the valid ones are created in one
+        transaction. The response holds the result of each tip, in order.
+        """
+        if not isinstance(request.data, list):
+            raise ValidationError("Expected a list of tips.")
+        if len(request.data) > settings.TIP_BATCH_MAX_SIZE:
+            raise ValidationError("At most {} tips can be created at once."
+                                  .format(settings.TIP_BATCH_MAX_SIZE))
+
+        results = []
+        valid = []
+        for item in request.data:
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                valid.append((len(results), serializer.validated_data))
+                results.append(None)
+            else:
+                results.append({
+                    'status': status.HTTP_400_BAD_REQUEST,
+                    'errors': serializer.errors,
+                })
+
+        found = load_locations([data for index, data in valid])
+        entries = []
+        indexes = []
+        for index, data in valid:
+            try:
+                location_data = pop_location_data(data, found)
+            except ValidationError as error:
+                results[index] = {
+                    'status': status.HTTP_400_BAD_REQUEST,
+                    'errors': error.detail,
+                }
+                continue
+            tip = Tip(tipper=request.user, score=0, **data)
+            entries.append((tip, location_data))
+            indexes.append(index)
+
+        tips = bulk.create_tips(entries)
+        created = Tip.objects.defer('search_vector').select_related('tipper')
+        created = created.prefetch_related(
+            'cities', 'subregions', 'regions', 'countries').in_bulk(
+                [tip.pk for tip in tips])
+        for index, tip in zip(indexes, tips):
+            results[index] = {
+                'status': status.HTTP_201_CREATED,
+                'data': self.get_serializer(created[tip.pk]).data,
+            }
+
+        if len(tips) == len(results):
+            response_status = status.HTTP_201_CREATED
+        elif tips:
+            response_status = status.HTTP_207_MULTI_STATUS
         else:
-            return queryset.order_by('-score').distinct()
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(results, status=response_status)
+
+    @action(detail=False)
+    def area(self, request):
+        """Tips of a map area, with the coordinates of their locations.
+
+        The area is either a bbox=min_lon,min_lat,max_lon,max_lat or a
+        circle of radius km around longitude and latitude. Tips of the most
+        populated cities of the area and of their subregions are listed by
+        score.
+        """
+        cities = locations.cities_in_area(
+            limit=settings.TIP_AREA_MAX_CITIES, **self.get_area())
+        city_points = {pk: (lon, lat) for pk, lon, lat, subregion in cities}
+        subregion_points = {}
+        for pk, lon, lat, subregion in cities:
+            if subregion is not None:
+                subregion_points.setdefault(subregion, []).append((lon, lat))
+        # Subregion tips are placed at the center of their cities in the area.
+        for subregion, points in subregion_points.items():
+            subregion_points[subregion] = (
+                sum(lon for lon, lat in points) / len(points),
+                sum(lat for lon, lat in points) / len(points))
+
+        covered = (
+            Q(level=TipLocation.CITY, location_id__in=list(city_points)) |
+            Q(level=TipLocation.SUBREGION,
+              location_id__in=list(subregion_points)))
+        queryset = Tip.objects.defer('search_vector').filter(
+            pk__in=TipLocation.objects.filter(covered).values('tip_id'),
+        ).select_related('tipper').order_by('-score', 'id')
+
+        paginator = TipAreaPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        points = {tip.pk: [] for tip in page}
+        links = TipLocation.objects.filter(
+            covered, tip_id__in=list(points)).order_by('level', 'location_id')
+        for tip_id, level, location_id in links.values_list(
+                'tip_id', 'level', 'location_id'):
+            if level == TipLocation.CITY:
+                point = city_points[location_id]
+            else:
+                point = subregion_points[location_id]
+            if point not in points[tip_id]:
+                points[tip_id].append(point)
+
+        data = self.get_serializer(page, many=True).data
+        for item in data:
+            item['points'] = [{'longitude': lon, 'latitude': lat}
+                              for lon, lat in points[item['id']]]
+        return paginator.get_paginated_response(data)
+
+    def get_area(self):
+        """Return the bbox or circle of the area request.
+        """
+        params = self.request.query_params
+        try:
+            if 'bbox' in params:
+                bbox = tuple(float(value)
+                             for value in params['bbox'].split(','))
+                if (len(bbox) != 4 or bbox[0] >= bbox[2] or
+                        bbox[1] >= bbox[3]):
+                    raise ValueError
+                return {'bbox': bbox}
+            center = Point(float(params['longitude']),
+                           float(params['latitude']), srid=4326)
+            radius_km = float(params.get('radius',
+                                         settings.TIP_NEARBY_RADIUS_KM))
+        except (KeyError, ValueError):
+            raise ValidationError(
+                "Expected bbox=min_lon,min_lat,max_lon,max_lat or longitude, "
+                "latitude and radius.")
+        if not 0 < radius_km <= settings.TIP_AREA_MAX_RADIUS_KM:
+            raise ValidationError("The radius must be at most {} km."
+                                  .format(settings.TIP_AREA_MAX_RADIUS_KM))
+        return {'center': center, 'radius_km': radius_km}
 
 
 class CityViewSet(viewsets.ModelViewSet):
     serializer_class = CityNestedSerializer
-    queryset = City.objects.all()
+    queryset = City.objects.select_related('subregion', 'region', 'country')
 
-    def get_queryset(self):
-        longitude = self.request.query_params.get('longitude', None)
-        latitude = self.request.query_params.get('latitude', None)
-        cities = City.objects.all()
-        if longitude and latitude:
-            location = Point(float(longitude), float(latitude))
-            cities = City.objects.filter(
-                    location__distance_lte=(location, D(km=100))).annotate(
-                            distance=Distance('location', location))
-            cities = cities.order_by('distance')
-        return cities
+    def get_digest(self, request):
+        return caching.get_cities_digest(request.get_full_path(),
+                                         request.get_host())
+
+    def list(self, request, *args, **kwargs):
+        return conditional_response(
+            request, self.get_digest(request), [caching.CITIES_VERSION_KEY],
+            lambda fresh: (self._list(request, *args, **kwargs), fresh))
+
+    def _list(self, request, *args, **kwargs):
+        """List cities, closest first when coordinates are given.
+
+        Cities are read as plain tuples and serialized by serialize_cities.
+        """
+        longitude = request.query_params.get('longitude', None)
+        latitude = request.query_params.get('latitude', None)
+        if not (longitude and latitude):
+            with timing.phase('fetch'):
+                rows = self.paginate_queryset(
+                    City.objects.values_list(*CITY_VALUES))
+            with timing.phase('serialize'):
+                data = serialize_cities(rows)
+            return self.get_paginated_response(data)
+
+        with timing.phase('resolve'):
+            city_ids = locations.nearby_city_ids(
+                float(longitude), float(latitude),
+                settings.CITY_NEARBY_RADIUS_KM)
+        with timing.phase('fetch'):
+            page = self.paginate_queryset(city_ids)
+            rows = {row[0]: row for row in City.objects.filter(
+                pk__in=page).values_list(*CITY_VALUES)}
+        with timing.phase('serialize'):
+            data = serialize_cities(rows[pk] for pk in page if pk in rows)
+        return self.get_paginated_response(data)
+
+    @action(detail=False)
+    def search(self, request):
+        """Cities whose name, or area name, starts with the q parameter.
+
+        Accents and case are ignored, and alternate names match too. The
+        most populated cities come first, closer ones are favored when
+        longitude and latitude are given.
+        """
+        return conditional_response(
+            request, self.get_digest(request), [caching.CITIES_VERSION_KEY],
+            lambda fresh: (self._search(request), fresh))
+
+    def _search(self, request):
+        params = request.query_params
+        try:
+            limit = int(params.get('limit', settings.CITY_TYPEAHEAD_LIMIT))
+            limit = max(1, min(limit, settings.CITY_TYPEAHEAD_MAX_LIMIT))
+            longitude = params.get('longitude', None)
+            latitude = params.get('latitude', None)
+            if longitude and latitude:
+                longitude, latitude = float(longitude), float(latitude)
+            else:
+                longitude = latitude = None
+        except ValueError:
+            raise ValidationError("Invalid limit or coordinates.")
+
+        nearby_ids = ()
+        if longitude is not None:
+            with timing.phase('resolve'):
+                nearby_ids = locations.nearby_city_ids(
+                    longitude, latitude, settings.CITY_TYPEAHEAD_DISTANCE_KM,
+                    typeahead.NEARBY_CITIES)
+        with timing.phase('search'):
+            city_ids = typeahead.get_index().search(
+                params.get('q', ''), limit, longitude, latitude, nearby_ids)
+        with timing.phase('fetch'):
+            rows = {row[0]: row for row in City.objects.filter(
+                pk__in=city_ids).values_list(*CITY_VALUES)}
+        with timing.phase('serialize'):
+            data = serialize_cities(rows[pk] for pk in city_ids if pk in rows)
+        return Response(data)
+
+
+class ClusterView(APIView):
+    """Tip counts of a map tile, grouped according to its zoom.
+    """
+    def get(self, request, zoom, x, y):
+        if zoom > clusters.MAX_ZOOM or x >= 2 ** zoom or y >= 2 ** zoom:
+            raise NotFound("Unknown tile.")
+        return Response(clusters.get_clusters(zoom, x, y))
+
+
+class TimingStatsView(APIView):
+    """Timings of the sampled requests served by this process.
+    """
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return Response({
+            'sample_rate': settings.TIMING_SAMPLE_RATE,
+            'routes': timing.stats.as_dict(),
+        })
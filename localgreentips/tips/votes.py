@@ -0,0 +1,49 @@
+"""Application of the votes to the tip scores.
+
+Voting only inserts a Vote row. Pending votes are then summed by tip and
+applied with one atomic F() update per tip by the apply_votes command, run
+as a worker with --loop, off the request path. Concurrent voters never wait
+on the lock of a popular tip, and several workers skip the votes another one
+is applying.
+"""
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from . import caching
+from .models import Tip, Vote
+
+logger = logging.getLogger(__name__)
+
+
+def apply_votes(batch_size=None):
+    """Apply a batch of pending votes to the tip scores.
+
+    Returns the number of votes applied.
+    """
+    batch_size = batch_size or settings.VOTE_FLUSH_BATCH_SIZE
+    with transaction.atomic():
+        pending = list(Vote.objects.select_for_update(skip_locked=True).filter(
+            applied=False).order_by('pk').values_list(
+                'pk', 'tip_id', 'value')[:batch_size])
+        if not pending:
+            return 0
+
+        deltas = defaultdict(int)
+        for vote_id, tip_id, value in pending:
+            deltas[tip_id] += value
+        # Always lock the tips in the same order to avoid deadlocks.
+        for tip_id in sorted(deltas):
+            if deltas[tip_id]:
+                Tip.objects.filter(pk=tip_id).update(
+                    score=F('score') + deltas[tip_id])
+        Vote.objects.filter(pk__in=[vote[0] for vote in pending]).update(
+            applied=True)
+
+    caching.bump_tips(deltas.keys())
+    logger.debug("Applied %d votes to %d tips", len(pending), len(deltas))
+    return len(pending)
+
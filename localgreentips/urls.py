@@ -28,5 +28,8 @@ urlpatterns = [
     path('', include(router.urls)),
     url(r'^auth/', include('djoser.urls')),
     url(r'^auth/', include('djoser.urls.authtoken')),
+    path('clusters/<int:zoom>/<int:x>/<int:y>/',
+         views.ClusterView.as_view()),
+    path('stats/timing/', views.TimingStatsView.as_view()),
     path('admin/', admin.site.urls),
 ]
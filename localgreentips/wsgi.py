@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/2.1/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'localgreentips.settings')
 
 application = get_wsgi_application()
+
+if settings.CITY_INDEX_PRELOAD:
+    # Build the in-memory city indexes before serving the first request.
+    from localgreentips.tips import spatial, typeahead
+    spatial.get_index()
+    typeahead.get_index()